@@ -0,0 +1,103 @@
+"""
+benchmark the scan pipeline (ARP sweep + hostname resolution) against a
+simulated LAN, no root or real network needed
+
+    python bench/scan_bench.py --prefix 24 22 20 --rate 2048 --loss 0.01
+
+after the sweep the found hosts are put in the simulated neighbour table and
+a refresh scan is timed, the way the daemon scans between full sweeps
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import resource
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import scanner
+from simlan import SimulatedLAN, FakeResolver
+
+
+def run(prefix, args):
+    network = '10.{}.0.1/{}'.format(prefix, prefix)
+    lan = SimulatedLAN(network, density=args.density, latency=args.latency / 1000,
+                       jitter=args.jitter / 1000, loss=args.loss)
+    resolver = FakeResolver(latency=args.dns_latency / 1000, timeout=args.dns_timeout)
+
+    if args.memory:
+        tracemalloc.start()
+    start = time.monotonic()
+    hosts = scanner.active_scan(lan.network.ip.compressed, rate=args.rate, iface='sim0',
+                                network=lan.network, io=lan)
+    swept = time.monotonic()
+    names = resolver.resolve_many([host['ip'] for host in hosts])
+    done = time.monotonic()
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else 0
+    tracemalloc.stop()
+
+    rng = random.Random(1)
+    lan.neighbour_table = [(host['ip'], host['mac'], 'stale' if rng.random() < args.stale else 'reachable')
+                           for host in hosts]
+    sent = lan.sent
+    began = time.monotonic()
+    refreshed = scanner.active_scan(lan.network.ip.compressed, rate=args.rate, iface='sim0',
+                                    network=lan.network, io=lan, full=None)
+    refresh = time.monotonic() - began
+
+    return {
+        'addresses': lan.network.network.num_addresses - 2,
+        'live': len(lan.hosts),
+        'found': len(hosts),
+        'named': sum(1 for name in names.values() if name),
+        'sweep': swept - start,
+        'resolve': done - swept,
+        'total': done - start,
+        'pps': lan.sent / (swept - start),
+        'peak_kb': peak / 1024,
+        'refresh': refresh,
+        'refresh_found': len({host['mac'] for host in refreshed}),
+        'refresh_sent': lan.sent - sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='scan pipeline benchmark on a simulated LAN')
+    parser.add_argument('--prefix', type=int, nargs='+', default=[24, 22, 20],
+                        help='subnet sizes to sweep, 24 22 20 are 254, 1022 and 4094 hosts')
+    parser.add_argument('--rate', type=int, default=scanner.PROBE_RATE, help='ARP probes per second')
+    parser.add_argument('--chunk', type=int, default=scanner.CHUNK_SIZE, help='probes per chunk')
+    parser.add_argument('--reply-timeout', type=float, default=0.5,
+                        help='seconds to wait for late replies, the daemon uses {}'.format(scanner.REPLY_TIMEOUT))
+    parser.add_argument('--density', type=float, default=0.25, help='share of addresses that are live')
+    parser.add_argument('--latency', type=float, default=2, help='reply latency in ms')
+    parser.add_argument('--jitter', type=float, default=2, help='random extra latency in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='share of replies lost')
+    parser.add_argument('--dns-latency', type=float, default=20, help='hostname lookup latency in ms')
+    parser.add_argument('--dns-timeout', type=float, default=1.0, help='hostname resolution deadline in s')
+    parser.add_argument('--stale', type=float, default=0.1,
+                        help='share of the neighbour table entries that are stale for the refresh')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip tracemalloc, it slows the run down')
+    args = parser.parse_args()
+
+    scanner.CHUNK_SIZE = args.chunk
+    scanner.REPLY_TIMEOUT = args.reply_timeout
+
+    print('{:>6} {:>6} {:>11} {:>8} {:>9} {:>8} {:>9} {:>9} {:>10} {:>10} {:>7} {:>7}'.format(
+        'prefix', 'addrs', 'found/live', 'named', 'sweep s', 'dns s', 'total s', 'pps', 'peak KiB',
+        'refresh s', 'found', 'sent'))
+    for prefix in args.prefix:
+        r = run(prefix, args)
+        print('{:>6} {:>6} {:>11} {:>8} {:>9.3f} {:>8.3f} {:>9.3f} {:>9.0f} {:>10.0f} {:>10.3f} {:>7} {:>7}'.format(
+            '/{}'.format(prefix), r['addresses'], '{}/{}'.format(r['found'], r['live']), r['named'],
+            r['sweep'], r['resolve'], r['total'], r['pps'], r['peak_kb'],
+            r['refresh'], r['refresh_found'], r['refresh_sent']))
+    print('max RSS {:.1f} MiB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == '__main__':
+    main()
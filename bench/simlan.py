@@ -0,0 +1,121 @@
+import time
+import heapq
+import random
+import socket
+import ipaddress
+import threading
+
+from resolver import HostnameResolver
+
+
+class SimulatedSender:
+    def __init__(self, lan):
+        self.lan = lan
+
+    def send(self, ips):
+        self.lan.arp_requests(ips)
+
+    def close(self):
+        pass
+
+
+class SimulatedLAN:
+    """
+    stand-in for scanner.ScapyIO: a subnet where a share of the addresses
+    answer ARP and ICMP after a configurable latency, some replies get lost
+    """
+    def __init__(self, network, density=0.25, latency=0.002, jitter=0.002, loss=0.0, seed=1):
+        self.network = ipaddress.IPv4Interface(network)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        addresses = [ip for ip in self.network.network.hosts() if ip != self.network.ip]
+        live = self.random.sample(addresses, int(len(addresses) * density))
+        self.hosts = {str(ip): '02:00:{:02x}:{:02x}:{:02x}:{:02x}'.format(*ip.packed) for ip in live}
+        self.sent = 0
+        # what the kernel neighbour table holds, (ip, mac, state)
+        self.neighbour_table = list()
+        self._listeners = list()
+        self._pending = list()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._deliver, daemon=True).start()
+
+    def _answers(self, ips):
+        return [ip for ip in ips if ip in self.hosts and self.random.random() >= self.loss]
+
+    def _delay(self):
+        return self.latency + self.random.random() * self.jitter
+
+    def arp_requests(self, ips):
+        self.sent += len(ips)
+        now = time.monotonic()
+        with self._cond:
+            for ip in self._answers(ips):
+                heapq.heappush(self._pending, (now + self._delay(), ip))
+            self._cond.notify()
+
+    def _deliver(self):
+        while True:
+            with self._cond:
+                while not self._pending or self._pending[0][0] > time.monotonic():
+                    self._cond.wait(timeout=self._pending[0][0] - time.monotonic() if self._pending else None)
+                due, ip = heapq.heappop(self._pending)
+                listeners = list(self._listeners)
+            for callback in listeners:
+                callback(ip, self.hosts[ip])
+
+    # scanner.ScapyIO interface
+
+    def listen_arp_replies(self, iface, callback):
+        with self._cond:
+            self._listeners.append(callback)
+
+        def stop():
+            with self._cond:
+                self._listeners.remove(callback)
+        return stop
+
+    def open_arp_sender(self, iface):
+        return SimulatedSender(self)
+
+    def ping(self, iface, ips, rate, timeout=2):
+        # sr() paces the requests and then waits out the timeout
+        self.sent += len(ips)
+        time.sleep(len(ips) / rate + min(timeout, self.latency + self.jitter))
+        return set(self._answers(ips))
+
+    def arp_exchange(self, iface, ips, timeout=1, macs=None):
+        self.sent += len(ips)
+        time.sleep(min(timeout, self.latency + self.jitter))
+        return [(ip, self.hosts[ip]) for ip in self._answers(ips)]
+
+    def arp_cache(self, iface):
+        return dict()
+
+    def neighbours(self, iface, family=socket.AF_INET):
+        # IPv4 only network, the table has no IPv6 entries
+        if family != socket.AF_INET:
+            return list()
+        return list(self.neighbour_table)
+
+    def ndp_discover(self, iface, timeout=1.5):
+        # IPv4 only network, nobody answers
+        time.sleep(min(timeout, self.latency + self.jitter))
+        return list()
+
+
+class FakeResolver(HostnameResolver):
+    """
+    HostnameResolver whose lookups take latency seconds and fail for a share of the hosts
+    """
+    def __init__(self, latency=0.02, failures=0.3, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.failures = failures
+
+    def _lookup(self, ip):
+        time.sleep(self.latency)
+        if int(ipaddress.IPv4Address(ip)) % 100 < self.failures * 100:
+            return ''
+        return 'host-{}.lan'.format(ip.replace('.', '-'))
@@ -19,7 +19,7 @@ pip install -r requirements.txt
 pip install pyinstaller==5.13.2
 
 # Build binaries
-PYTHONPATH=$PWD pyinstaller -s -F --hidden-import=ctypes --collect-all scapy server/tuxcutd.py
+PYTHONPATH=$PWD pyinstaller -s -F --hidden-import=ctypes --collect-all scapy --collect-all pyroute2 server/tuxcutd.py
 PYTHONPATH=$PWD pyinstaller -s -F --hidden-import=ctypes --collect-all dearpygui client/tuxcut.py
 
 # Prepare package files
@@ -28,6 +28,13 @@ mkdir -p pkg/opt/tuxcut/
 mv dist/tuxcut pkg/opt/tuxcut/
 mv dist/tuxcutd pkg/opt/tuxcut/
 
+# Vendor names for the hosts table, the daemon runs fine without them
+if curl -fsSL -o oui.csv https://standards-oui.ieee.org/oui/oui.csv; then
+    python3 server/oui.py build oui.csv pkg/opt/tuxcut/oui.bin
+else
+    echo "Could not download the OUI registry, building without vendor names"
+fi
+
 # Get version
 VERSION=$(date +'%Y.%m.%d')
 if [ -n "$GITHUB_REF" ] && [[ $GITHUB_REF == refs/tags/* ]]; then
@@ -41,8 +48,6 @@ fpm -s dir -t deb \
     --iteration 1 \
     -d "libpcap0.8" \
     -d "arptables" \
-    -d "dnsutils" \
-    -d "net-tools" \
     -d "libxcb-xinerama0" \
     -d "libxcb-cursor0" \
     -C pkg
@@ -54,8 +59,6 @@ fpm -s dir -t rpm \
     --iteration 1 \
     -d "libpcap" \
     -d "arptables" \
-    -d "bind-utils" \
-    -d "net-tools" \
     -d "libxcb-xinerama0" \
     -d "libxcb-cursor0" \
     -C pkg
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger('tuxcut-client')
+
+SERVER_URL = 'http://127.0.0.1:8013'
+# used instead of SERVER_URL when the daemon was started with --unix
+SOCKET_PATH = '/run/tuxcut/tuxcutd.sock'
+
+# endpoint -> ((connect, read) timeout in seconds, safe to retry)
+ENDPOINTS = {
+    'status': ((1, 2), True),
+    'bootstrap': ((1, 10), True),
+    'gw': ((1, 10), True),
+    'my': ((1, 10), True),
+    'hosts': ((1, 5), True),
+    'arp-events': ((1, 5), True),
+    'presence': ((1, 5), True),
+    'scan-stream': ((1, 30), False),
+    'cut': ((1, 5), False),
+    'resume': ((1, 15), False),
+    'protect': ((1, 10), False),
+    'unprotect': ((1, 10), False),
+    'change-mac': ((1, 30), False),
+}
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, socket_path, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    def __init__(self, socket_path, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return UnixHTTPConnection(self.socket_path, timeout=self.timeout.connect_timeout)
+
+
+class UnixAdapter(HTTPAdapter):
+    """
+    requests adapter that sends every request to one Unix domain socket
+    """
+    def __init__(self, socket_path, pool_maxsize=4, **kwargs):
+        self._pool = UnixHTTPConnectionPool(socket_path, maxsize=pool_maxsize)
+        super().__init__(pool_maxsize=pool_maxsize, **kwargs)
+
+    def get_connection(self, url, proxies=None):
+        return self._pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool
+
+    def close(self):
+        self._pool.close()
+        super().close()
+
+
+class DaemonClient:
+    """
+    all GUI calls to tuxcutd go through here, over a keep-alive connection pool
+    with per endpoint timeouts and retries for the idempotent calls
+
+    the daemon's Unix socket is used when it exists, TCP loopback otherwise
+    """
+    def __init__(self, base_url=SERVER_URL, socket_path=SOCKET_PATH, retries=2, pool_size=4):
+        retry = Retry(total=retries, backoff_factor=0.1, allowed_methods=frozenset(['GET']),
+                      status_forcelist=(502, 503, 504), raise_on_status=False)
+        if socket_path and os.path.exists(socket_path):
+            logger.info(f'Talking to the server over {socket_path}')
+            self.base_url = 'http://localhost'
+            self._retrying = self._session(UnixAdapter(socket_path, pool_maxsize=pool_size, max_retries=retry))
+            self._once = self._session(UnixAdapter(socket_path, pool_maxsize=pool_size, max_retries=0))
+        else:
+            self.base_url = base_url
+            self._retrying = self._session(HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+            self._once = self._session(HTTPAdapter(pool_maxsize=pool_size, max_retries=0))
+        # endpoint -> [calls, total seconds, max seconds]
+        self._latency = dict()
+        self._lock = threading.Lock()
+
+    def _session(self, adapter):
+        session = requests.Session()
+        session.mount('http://', adapter)
+        return session
+
+    def _record(self, endpoint, elapsed):
+        with self._lock:
+            calls, total, worst = self._latency.get(endpoint, (0, 0.0, 0.0))
+            self._latency[endpoint] = (calls + 1, total + elapsed, max(worst, elapsed))
+
+    def _request(self, method, endpoint, path, **kwargs):
+        timeout, idempotent = ENDPOINTS[endpoint]
+        session = self._retrying if idempotent else self._once
+        start = time.monotonic()
+        try:
+            res = session.request(method, self.base_url + path, timeout=timeout, **kwargs)
+            res.raise_for_status()
+            return res
+        finally:
+            elapsed = time.monotonic() - start
+            self._record(endpoint, elapsed)
+            logger.debug(f'{method} {path} took {elapsed * 1000:.1f} ms')
+
+    def latency(self):
+        """
+        {endpoint: {'calls', 'avg_ms', 'max_ms'}} for the calls made so far
+        """
+        with self._lock:
+            return {endpoint: {'calls': calls,
+                               'avg_ms': round(total / calls * 1000, 1),
+                               'max_ms': round(worst * 1000, 1)}
+                    for endpoint, (calls, total, worst) in self._latency.items()}
+
+    def status(self):
+        return self._request('GET', 'status', '/status').json()
+
+    def bootstrap(self):
+        return self._request('GET', 'bootstrap', '/bootstrap').json()
+
+    def gateway(self):
+        return self._request('GET', 'gw', '/gw').json()
+
+    def my(self, iface):
+        return self._request('GET', 'my', f'/my/{iface}').json()
+
+    def hosts(self, since=0, epoch=None):
+        params = {'since': since}
+        if epoch:
+            params['epoch'] = epoch
+        return self._request('GET', 'hosts', '/hosts', params=params).json()
+
+    def arp_events(self, since=0):
+        return self._request('GET', 'arp-events', '/arp-events', params={'since': since}).json()
+
+    def presence(self, hours=24):
+        return self._request('GET', 'presence', '/presence', params={'hours': hours}).json()
+
+    def scan_stream(self, ip):
+        """
+        yield the scan events one by one as the server sends them
+        """
+        res = self._request('GET', 'scan-stream', f'/scan-stream/{ip}', stream=True)
+        with res:
+            # one byte at a time, the default chunk holds events back until 512 bytes pile up
+            for line in res.iter_lines(chunk_size=1):
+                if line:
+                    yield json.loads(line)
+
+    def cut(self, host):
+        return self._request('POST', 'cut', '/cut', json=host).json()
+
+    def resume(self, host):
+        return self._request('POST', 'resume', '/resume', json=host).json()
+
+    def protect(self, gw):
+        return self._request('POST', 'protect', '/protect', data=gw).json()
+
+    def unprotect(self):
+        return self._request('GET', 'unprotect', '/unprotect').json()
+
+    def change_mac(self, iface):
+        return self._request('GET', 'change-mac', f'/change-mac/{iface}').json()
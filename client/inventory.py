@@ -0,0 +1,126 @@
+import os
+import glob
+import time
+import shelve
+import sqlite3
+import logging
+import threading
+
+
+logger = logging.getLogger('tuxcut-client')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    mac TEXT PRIMARY KEY,
+    ip TEXT NOT NULL DEFAULT '',
+    alias TEXT NOT NULL DEFAULT '',
+    vendor TEXT NOT NULL DEFAULT '',
+    hostname TEXT NOT NULL DEFAULT '',
+    first_seen REAL,
+    last_seen REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hosts_ip ON hosts (ip);
+"""
+
+# keep what we already know when a scan comes back without ip, vendor or hostname
+UPSERT = """
+INSERT INTO hosts (mac, ip, vendor, hostname, first_seen, last_seen)
+VALUES (:mac, :ip, :vendor, :hostname, :seen, :seen)
+ON CONFLICT (mac) DO UPDATE SET
+    ip = CASE WHEN excluded.ip != '' THEN excluded.ip ELSE ip END,
+    vendor = CASE WHEN excluded.vendor != '' THEN excluded.vendor ELSE vendor END,
+    hostname = CASE WHEN excluded.hostname != '' THEN excluded.hostname ELSE hostname END,
+    first_seen = COALESCE(first_seen, excluded.first_seen),
+    last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)
+"""
+
+
+class HostInventory:
+    """
+    every host the GUI has ever seen, with its alias, in a SQLite database
+    keyed by MAC, shared by the UI and the scan threads
+    """
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+
+    def upsert(self, hosts, now=None):
+        """
+        record a batch of hosts from a scan in one transaction
+        """
+        now = time.time() if now is None else now
+        rows = [{'mac': host['mac'].lower(), 'ip': host['ip'],
+                 'vendor': host.get('vendor') or '', 'hostname': host.get('hostname') or '',
+                 'seen': host.get('last_seen') or now} for host in hosts]
+        if not rows:
+            return
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany(UPSERT, rows)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def set_alias(self, mac, alias, ip=''):
+        with self._lock:
+            self._db.execute('INSERT INTO hosts (mac, ip, alias) VALUES (?, ?, ?) '
+                             'ON CONFLICT (mac) DO UPDATE SET alias = excluded.alias',
+                             (mac.lower(), ip, alias))
+
+    def alias(self, mac):
+        with self._lock:
+            row = self._db.execute('SELECT alias FROM hosts WHERE mac = ?', (mac.lower(),)).fetchone()
+        return row['alias'] if row else ''
+
+    def get(self, mac):
+        """
+        everything known about mac as a dict, None if it was never seen
+        """
+        with self._lock:
+            row = self._db.execute('SELECT * FROM hosts WHERE mac = ?', (mac.lower(),)).fetchone()
+        return dict(row) if row else None
+
+    def by_ip(self, ip):
+        """
+        the hosts that used ip, most recently seen first
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM hosts WHERE ip = ? ORDER BY last_seen DESC', (ip,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+
+    def migrate_shelve(self, path):
+        """
+        import the aliases from the old shelve store once, its files are
+        renamed afterwards so this is a no-op on the next start
+        """
+        files = [name for name in glob.glob(glob.escape(path) + '*') if not name.endswith('.migrated')]
+        if not files:
+            return 0
+        with shelve.open(path, flag='r') as old:
+            aliases = dict(old)
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany('INSERT INTO hosts (mac, alias) VALUES (?, ?) '
+                                 'ON CONFLICT (mac) DO UPDATE SET alias = excluded.alias',
+                                 [(mac.lower(), alias) for mac, alias in aliases.items()])
+            self._db.execute('COMMIT')
+        for name in files:
+            os.replace(name, name + '.migrated')
+        logger.info(f"Migrated {len(aliases)} aliases from {path}")
+        return len(aliases)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
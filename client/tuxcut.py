@@ -2,14 +2,16 @@ import os
 import sys
 import logging
 from pathlib import Path
-import shelve
 import requests
-from threading import Thread
+from threading import Thread, RLock
 import dearpygui.dearpygui as dpg
 from setproctitle import setproctitle
 import traceback
 import netifaces
 import json
+import time
+from daemon_client import DaemonClient
+from inventory import HostInventory
 
 # Setup logging
 APP_DIR = os.path.join(str(Path.home()), '.tuxcut')
@@ -28,6 +30,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger('tuxcut-client')
 
+# seconds between host table delta requests to the server
+HOSTS_POLL_INTERVAL = 5
+# seconds between presence timeline requests, they only change once a minute
+PRESENCE_POLL_INTERVAL = 60
+# hours shown in the presence sparkline, one character each
+PRESENCE_HOURS = 24
+SPARK_CHARS = ' ▁▂▃▄▅▆▇█'
+# toolbar items that are greyed out when the server or the network can't be reached
+ACTION_TAGS = ['protect_toggle', 'refresh_button', 'cut_button', 'resume_button',
+               'change_mac_button', 'alias_button']
+
 try:
     logger.info("Starting TuxCut client...")
     
@@ -35,18 +48,31 @@ try:
         def __init__(self):
             logger.debug("Initializing TuxCutGUI...")
             self.live_hosts = []
+            self._hosts = {}
+            self._hosts_version = 0
+            # changes with each daemon run, versions from another run mean nothing
+            self._hosts_epoch = None
+            self._last_poll = 0
+            self._polling = False
+            self._last_arp_event = 0
+            self._presence = {}
+            self._last_presence = 0
             self._offline_hosts = []
             self._gw = {}
             self._my = {}
+            self.daemon = DaemonClient()
+            # mac -> {'row': row id, 'cells': cell ids, 'values': cell values}
+            self._rows = {}
+            self._selected_mac = None
+            # _hosts and _rows are changed from the scan and the poll threads
+            self._lock = RLock()
             
-            # Load aliases
+            # Host inventory with the aliases, moved over from the old shelve store once
+            self.inventory = HostInventory(os.path.join(APP_DIR, 'hosts.sqlite'))
             try:
-                with shelve.open(os.path.join(APP_DIR, 'aliases.db')) as aliases:
-                    self.aliases = dict(aliases)
-                logger.debug("Loaded aliases successfully")
+                self.inventory.migrate_shelve(os.path.join(APP_DIR, 'aliases.db'))
             except Exception as e:
-                logger.error(f"Failed to load aliases: {str(e)}")
-                self.aliases = {}
+                logger.error(f"Failed to migrate aliases: {str(e)}")
 
             try:
                 # Initialize DPG
@@ -57,7 +83,7 @@ try:
                 logger.debug("Creating viewport...")
                 dpg.create_viewport()
                 dpg.set_viewport_title("TuxCut")
-                dpg.set_viewport_width(800)
+                dpg.set_viewport_width(1380)
                 dpg.set_viewport_height(600)
                 dpg.set_viewport_min_width(600)
                 dpg.set_viewport_min_height(400)
@@ -76,16 +102,16 @@ try:
                 # Create primary window
                 with dpg.window(label="TuxCut", tag="main_window", no_close=True):
                     # Protection checkbox
-                    dpg.add_checkbox(label="Protect My Computer", callback=self.toggle_protection)
+                    dpg.add_checkbox(label="Protect My Computer", callback=self.toggle_protection, tag="protect_toggle")
                     
                     # Toolbar buttons
                     with dpg.group(horizontal=True):
-                        dpg.add_button(label="Refresh", callback=self.on_refresh)
-                        dpg.add_button(label="Cut", callback=self.on_cut)
-                        dpg.add_button(label="Resume", callback=self.on_resume)
+                        dpg.add_button(label="Refresh", callback=self.on_refresh, tag="refresh_button")
+                        dpg.add_button(label="Cut", callback=self.on_cut, tag="cut_button")
+                        dpg.add_button(label="Resume", callback=self.on_resume, tag="resume_button")
                         dpg.add_spacer(width=10)
-                        dpg.add_button(label="Change MAC", callback=self.on_change_mac)
-                        dpg.add_button(label="Set Alias", callback=self.on_give_alias)
+                        dpg.add_button(label="Change MAC", callback=self.on_change_mac, tag="change_mac_button")
+                        dpg.add_button(label="Set Alias", callback=self.on_give_alias, tag="alias_button")
                         dpg.add_spacer(width=10)
                         dpg.add_button(label="Exit", callback=self.on_exit)
 
@@ -97,9 +123,13 @@ try:
                                 borders_outerV=True):
                         dpg.add_table_column(label="Status", width_fixed=True, init_width_or_weight=50)
                         dpg.add_table_column(label="IP Address", width_fixed=True, init_width_or_weight=120)
+                        dpg.add_table_column(label="IPv6 Address", width_fixed=True, init_width_or_weight=200)
+                        dpg.add_table_column(label="Interface", width_fixed=True, init_width_or_weight=70)
                         dpg.add_table_column(label="MAC Address", width_fixed=True, init_width_or_weight=140)
+                        dpg.add_table_column(label="Vendor", width_fixed=True, init_width_or_weight=160)
                         dpg.add_table_column(label="Hostname", width_fixed=True, init_width_or_weight=200)
-                        dpg.add_table_column(label="Alias")
+                        dpg.add_table_column(label="Alias", width_fixed=True, init_width_or_weight=120)
+                        dpg.add_table_column(label=f"Last {PRESENCE_HOURS}h")
 
                     dpg.add_spacer(height=5)
                     
@@ -107,6 +137,8 @@ try:
                     with dpg.group(horizontal=True):
                         dpg.add_text("Status: ", tag="status_label")
                         dpg.add_text("Ready", tag="status_bar")
+                        dpg.add_spacer(width=10)
+                        dpg.add_text("", tag="arp_alert", color=(255, 80, 80))
 
                 logger.debug("Window created successfully")
                 
@@ -118,29 +150,9 @@ try:
                 dpg.show_viewport()
                 logger.debug("Viewport shown")
                 
-                # Check server and initialize
-                logger.debug("Checking server status...")
-                if not self.is_server():
-                    logger.error("Server not running")
-                    self.show_error("TuxCut Server stopped", 
-                                "Use 'systemctl start tuxcutd' then restart the application")
-                    sys.exit(1)
-                logger.debug("Server is running")
-
-                # Get gateway info
-                logger.debug("Getting gateway info...")
-                self.get_gw()
-                iface = self._gw.get('iface')
-                if not iface:
-                    logger.error("No network interface found")
-                    self.show_error("Error", "No network interface found")
-                    sys.exit(1)
-                logger.debug(f"Using interface: {iface}")
-
-                self.get_my(iface)
-                logger.debug("Network initialization complete")
-                self.trigger_thread()
-                logger.debug("Initial scan triggered")
+                # Ask the server for everything else without holding up the window
+                self.set_status('Connecting to the server ...')
+                Thread(target=self.t_bootstrap, daemon=True).start()
                 
             except Exception as e:
                 logger.error(f"Failed to initialize GUI: {str(e)}")
@@ -154,6 +166,17 @@ try:
             except Exception as e:
                 logger.error(f"Failed to set status: {str(e)}")
 
+        def disable_actions(self, msg):
+            """
+            grey out everything that needs the server or the network, with msg in the status bar
+            """
+            self.set_status(msg)
+            for tag in ACTION_TAGS:
+                try:
+                    dpg.disable_item(tag)
+                except Exception as e:
+                    logger.error(f"Failed to disable {tag}: {str(e)}")
+
         def show_error(self, title, message):
             try:
                 logger.error(f"Error dialog: {title} - {message}")
@@ -166,47 +189,117 @@ try:
                 logger.error(f"Failed to show error dialog: {str(e)}")
                 print(f"Error: {title} - {message}")  # Fallback to console
 
+        def host_row_values(self, host):
+            status = "🔴" if host['ip'] in self._offline_hosts else "🟢"
+            alias = self.inventory.alias(host['mac'])
+            return [status, host['ip'], ', '.join(host.get('ipv6', [])), host.get('iface', ''), host['mac'],
+                    host.get('vendor', ''), host['hostname'], alias,
+                    self.sparkline(self._presence.get(host['mac'], []))]
+
+        def sparkline(self, minutes):
+            """
+            one block character per hour, taller the more minutes the host was seen
+            """
+            steps = len(SPARK_CHARS) - 1
+            return ''.join(SPARK_CHARS[-(-value * steps // 60)] for value in minutes)
+
+        def update_host_row(self, host):
+            """
+            add the row for host, or update only the cells whose value changed
+            """
+            values = self.host_row_values(host)
+            with self._lock:
+                row = self._rows.get(host['mac'])
+                if row is None:
+                    with dpg.table_row(parent="hosts_table") as row_id:
+                        # the status cell spans the row so clicking anywhere selects the host
+                        cells = [dpg.add_selectable(label=values[0], span_columns=True,
+                                                    callback=self.on_select_host, user_data=host['mac'])]
+                        cells += [dpg.add_text(value) for value in values[1:]]
+                    self._rows[host['mac']] = {'row': row_id, 'cells': cells, 'values': values}
+                    return
+
+                for i, value in enumerate(values):
+                    if row['values'][i] != value:
+                        if i == 0:
+                            dpg.configure_item(row['cells'][i], label=value)
+                        else:
+                            dpg.set_value(row['cells'][i], value)
+                row['values'] = values
+
+        def refresh_host_row(self, mac):
+            """
+            redraw the row of mac, if the host is still in the table
+            """
+            with self._lock:
+                host = self._hosts.get(mac)
+                if host is not None:
+                    self.update_host_row(host)
+
+        def remove_host_row(self, mac):
+            with self._lock:
+                row = self._rows.pop(mac, None)
+                if row is not None:
+                    dpg.delete_item(row['row'])
+                if self._selected_mac == mac:
+                    self._selected_mac = None
+
         def fill_hosts_view(self, live_hosts):
-            # Clear existing rows
-            for child in dpg.get_item_children("hosts_table", slot=1):
-                dpg.delete_item(child)
-            
-            for host in live_hosts:
-                status = "🔴" if host['ip'] in self._offline_hosts else "🟢"
-                alias = self.aliases.get(host['mac'], '')
-                
-                with dpg.table_row(parent="hosts_table"):
-                    dpg.add_text(status)
-                    dpg.add_text(host['ip'])
-                    dpg.add_text(host['mac'])
-                    dpg.add_text(host['hostname'])
-                    dpg.add_text(alias)
+            """
+            reconcile the table rows, keyed by MAC, with live_hosts
+            """
+            macs = {host['mac'] for host in live_hosts}
+            with self._lock:
+                for mac in [mac for mac in self._rows if mac not in macs]:
+                    self.remove_host_row(mac)
+                for host in live_hosts:
+                    self.update_host_row(host)
 
             self.set_status("Ready")
 
+        def on_select_host(self, sender, app_data, user_data):
+            with self._lock:
+                if self._selected_mac in self._rows and self._selected_mac != user_data:
+                    dpg.set_value(self._rows[self._selected_mac]['cells'][0], False)
+                self._selected_mac = user_data if app_data else None
+
         def get_selected_host(self):
-            for i, row in enumerate(dpg.get_item_children("hosts_table", slot=1)):
-                if dpg.is_item_clicked(row):
-                    children = dpg.get_item_children(row, slot=1)
-                    return {
-                        'ip': dpg.get_value(children[1]),
-                        'mac': dpg.get_value(children[2]),
-                        'hostname': dpg.get_value(children[3])
-                    }
-            return None
+            with self._lock:
+                host = self._hosts.get(self._selected_mac)
+            if host is None:
+                return None
+            return {
+                'ip': host['ip'],
+                'mac': host['mac'],
+                'hostname': host['hostname'],
+                'iface': host.get('iface', '')
+            }
 
         def on_cut(self):
             host = self.get_selected_host()
             if not host:
                 self.set_status("Please select a host to cut")
                 return
+            if not host['ip']:
+                self.set_status("Only hosts with an IPv4 address can be cut")
+                return
+            if host['iface'] and host['iface'] != self._gw.get('iface'):
+                self.set_status(f"Only hosts on {self._gw.get('iface')} can be cut")
+                return
 
-            res = requests.post('http://127.0.0.1:8013/cut', json=host)
-            if res.status_code == 200 and res.json()['status'] == 'success':
+            try:
+                res = self.daemon.cut(host)
+            except requests.RequestException as e:
+                logger.error(str(e), exc_info=True)
+                self.set_status(f"Couldn't cut {host['ip']}")
+                return
+            if res['status'] == 'success':
                 if host['ip'] not in self._offline_hosts:
                     self._offline_hosts.append(host['ip'])
-                self.trigger_thread()
+                self.refresh_host_row(host['mac'])
                 self.set_status(f"{host['ip']} is now offline")
+            else:
+                self.set_status(res.get('msg', f"Couldn't cut {host['ip']}"))
 
         def on_resume(self):
             host = self.get_selected_host()
@@ -214,22 +307,29 @@ try:
                 self.set_status("Please select a host to resume")
                 return
 
-            res = requests.post('http://127.0.0.1:8013/resume', json=host)
-            if res.status_code == 200 and res.json()['status'] == 'success':
+            try:
+                res = self.daemon.resume(host)
+            except requests.RequestException as e:
+                logger.error(str(e), exc_info=True)
+                self.set_status(f"Couldn't resume {host['ip']}")
+                return
+            if res['status'] == 'success':
                 if host['ip'] in self._offline_hosts:
                     self._offline_hosts.remove(host['ip'])
-                self.trigger_thread()
+                self.refresh_host_row(host['mac'])
                 self.set_status(f"{host['ip']} is back online")
 
         def on_refresh(self):
             self.trigger_thread()
 
         def on_change_mac(self):
-            res = requests.get(f"http://127.0.0.1:8013/change-mac/{self._gw['iface']}")
-            if res.status_code == 200:
-                status = res.json()['result']['status']
-                msg = "MAC Address changed" if status == 'success' else "Couldn't change MAC"
-                self.set_status(msg)
+            try:
+                status = self.daemon.change_mac(self._gw['iface'])['result']['status']
+            except requests.RequestException as e:
+                logger.error(str(e), exc_info=True)
+                status = 'failed'
+            msg = "MAC Address changed" if status == 'success' else "Couldn't change MAC"
+            self.set_status(msg)
 
         def on_give_alias(self):
             host = self.get_selected_host()
@@ -239,10 +339,8 @@ try:
 
             def save_alias(sender):
                 alias = dpg.get_value("alias_input")
-                self.aliases[host['mac']] = alias
-                with shelve.open(os.path.join(APP_DIR, 'aliases.db')) as db:
-                    db[host['mac']] = alias
-                self.trigger_thread()
+                self.inventory.set_alias(host['mac'], alias, host['ip'])
+                self.refresh_host_row(host['mac'])
                 dpg.delete_item("alias_modal")
 
             with dpg.window(label="Set Alias", modal=True, show=True, tag="alias_modal",
@@ -263,37 +361,175 @@ try:
 
         def protect(self):
             try:
-                res = requests.post('http://127.0.0.1:8013/protect', data=self._gw)
-                if res.status_code == 200 and res.json()['status'] == 'success':
+                res = self.daemon.protect(self._gw)
+                if res['status'] == 'success':
                     self.set_status('Protection Enabled')
             except Exception as e:
                 logger.error(str(e), exc_info=True)
 
         def unprotect(self):
             try:
-                res = requests.get('http://127.0.0.1:8013/unprotect')
-                if res.status_code == 200 and res.json()['status'] == 'success':
+                res = self.daemon.unprotect()
+                if res['status'] == 'success':
                     self.set_status('Protection Disabled')
             except Exception as e:
                 logger.error(str(e), exc_info=True)
 
+        def t_bootstrap(self):
+            """
+            fill in the gateway, our own info and the known hosts from one
+            /bootstrap call, then start a fresh scan
+            """
+            try:
+                data = self.daemon.bootstrap()
+            except requests.RequestException as e:
+                logger.error(f"Bootstrap request failed: {str(e)}")
+                data = {}
+
+            if data.get('status') == 'success' and data['gw'].get('iface') and data['my'].get('ip'):
+                self._gw = data['gw']
+                self._my = data['my']
+                with self._lock:
+                    self._hosts = {host['mac']: host for host in data['hosts']}
+                    self._hosts_version = data['version']
+                    self._hosts_epoch = data.get('epoch')
+                    self.live_hosts = list(self._hosts.values())
+                    self.fill_hosts_view(self.live_hosts)
+                logger.debug(f"Bootstrapped with {len(self.live_hosts)} known hosts")
+            else:
+                # server not running, too old for /bootstrap or without gateway info yet
+                logger.debug("Checking server status...")
+                if not self.is_server():
+                    logger.error("Server not running")
+                    self.show_error("TuxCut Server stopped",
+                                "Use 'systemctl start tuxcutd' then restart the application")
+                    self.disable_actions("Server not running")
+                    return
+
+                if not self.get_gw() or not self._gw.get('iface'):
+                    logger.error("No network interface found")
+                    self.disable_actions("No network connection")
+                    return
+                iface = self._gw['iface']
+                logger.debug(f"Using interface: {iface}")
+                if not self.get_my(iface):
+                    self.disable_actions(f"No IPv4 address on {iface}")
+                    return
+
+            logger.debug("Network initialization complete")
+            self.trigger_thread()
+            logger.debug("Initial scan triggered")
+
         def trigger_thread(self):
+            if not self._my:
+                # still waiting for t_bootstrap
+                return
             self.set_status('Refreshing hosts list ...')
             Thread(target=self.t_get_hosts).start()
 
         def t_get_hosts(self):
+            """
+            consume the streaming scan so rows show up as hosts are discovered
+            """
             try:
-                res = requests.get(f"http://127.0.0.1:8013/scan/{self._my['ip']}")
-                if res.status_code == 200:
-                    self.live_hosts = res.json()['result']['hosts']
+                live_hosts = {}
+                done = {}
+                for event in self.daemon.scan_stream(self._my['ip']):
+                    if event['event'] == 'host':
+                        host = event['host']
+                        live_hosts[host['mac']] = host
+                        with self._lock:
+                            self._hosts[host['mac']] = host
+                            self.update_host_row(host)
+                        self.set_status(f"Refreshing hosts list ... {len(live_hosts)} found")
+                    elif event['event'] == 'hostname':
+                        host = live_hosts.get(event['mac'])
+                        if host:
+                            host['hostname'] = event['hostname']
+                            self.update_host_row(host)
+                    elif event['event'] == 'done':
+                        if event['status'] != 'success':
+                            logger.error(f"Scan failed: {event.get('msg')}")
+                        done = event
+                with self._lock:
+                    # the version of the snapshot the scan started from, the next poll
+                    # brings whatever changed while it ran
+                    self._hosts_version = done.get('version', self._hosts_version)
+                    self._hosts_epoch = done.get('epoch', self._hosts_epoch)
+                    self._hosts = live_hosts
+                    self.live_hosts = list(live_hosts.values())
                     self.fill_hosts_view(self.live_hosts)
+                self.inventory.upsert(self.live_hosts)
+            except Exception as e:
+                logger.error(str(e), exc_info=True)
+
+        def poll_hosts(self):
+            if self._polling or not self._my or time.monotonic() - self._last_poll < HOSTS_POLL_INTERVAL:
+                return
+            self._polling = True
+            self._last_poll = time.monotonic()
+            Thread(target=self.t_poll_hosts, daemon=True).start()
+
+        def t_poll_hosts(self):
+            """
+            apply the host table changes since the version we already have
+            """
+            try:
+                delta = self.daemon.hosts(since=self._hosts_version, epoch=self._hosts_epoch)
+                if delta['status'] == 'success':
+                    self.inventory.upsert(delta['added'] + delta['changed'])
+                    with self._lock:
+                        if delta['full']:
+                            self._hosts = {}
+                        for host in delta['added'] + delta['changed']:
+                            self._hosts[host['mac']] = host
+                        for mac in delta['removed']:
+                            self._hosts.pop(mac, None)
+                        self._hosts_version = delta['version']
+                        self._hosts_epoch = delta.get('epoch')
+                        if delta['full'] or delta['added'] or delta['changed'] or delta['removed']:
+                            self.live_hosts = list(self._hosts.values())
+                            self.fill_hosts_view(self.live_hosts)
+                self.check_arp_events()
+                if time.monotonic() - self._last_presence >= PRESENCE_POLL_INTERVAL:
+                    self.update_presence()
             except Exception as e:
                 logger.error(str(e), exc_info=True)
+            finally:
+                self._polling = False
+
+        def update_presence(self):
+            """
+            refresh the presence sparklines of all rows
+            """
+            self._last_presence = time.monotonic()
+            res = self.daemon.presence(PRESENCE_HOURS)
+            if res['status'] != 'success':
+                return
+            self._presence = res['presence']
+            with self._lock:
+                for host in self._hosts.values():
+                    if host['mac'] in self._rows:
+                        self.update_host_row(host)
+
+        def check_arp_events(self):
+            """
+            show the latest spoofing alert from the server's ARP monitor
+            """
+            res = self.daemon.arp_events(since=self._last_arp_event)
+            if res['status'] != 'success':
+                return
+            for event in res['events']:
+                self._last_arp_event = event['id']
+                if event['severity'] == 'info':
+                    logger.info(f"ARP monitor: {event['msg']}")
+                    continue
+                logger.warning(f"ARP monitor: {event['msg']}")
+                dpg.set_value("arp_alert", f"⚠ {event['msg']}")
 
         def is_server(self):
             try:
-                res = requests.get('http://127.0.0.1:8013/status')
-                return res.status_code == 200 and res.json()['status'] == 'success'
+                return self.daemon.status()['status'] == 'success'
             except:
                 logger.error(sys.exc_info()[1], exc_info=True)
                 return False
@@ -301,15 +537,15 @@ try:
         def get_gw(self):
             try:
                 # First try to get from server
-                res = requests.get('http://127.0.0.1:8013/gw')
-                logger.debug(f"Gateway response: {res.text}")
-                
-                if res.status_code == 200:
-                    data = res.json()
+                try:
+                    data = self.daemon.gateway()
+                    logger.debug(f"Gateway response: {json.dumps(data)}")
                     if data['status'] == 'success':
                         self._gw = data['gw']
                         logger.debug(f"Got gateway info from server: {json.dumps(self._gw)}")
-                        return
+                        return True
+                except requests.RequestException as e:
+                    logger.error(f"Gateway request failed: {str(e)}")
                     
                 # If server fails, try to detect locally
                 logger.debug("Server gateway detection failed, trying local detection...")
@@ -333,17 +569,17 @@ try:
                             'mac': self.get_mac_address(iface)
                         }
                         logger.debug(f"Using gateway config: {json.dumps(self._gw)}")
-                        return
+                        return True
                 
                 logger.error("No valid network interface found")
                 self.show_error('Error', 'No valid network interface found. Please check your network connection.')
-                sys.exit(1)
+                return False
                 
             except Exception as e:
                 logger.error(f"Error getting gateway info: {str(e)}")
                 logger.error(traceback.format_exc())
                 self.show_error('Error', f'Failed to get gateway info: {str(e)}')
-                sys.exit(1)
+                return False
 
         def get_mac_address(self, iface):
             try:
@@ -357,15 +593,15 @@ try:
         def get_my(self, iface):
             try:
                 # First try server
-                res = requests.get(f'http://127.0.0.1:8013/my/{iface}')
-                logger.debug(f"My info response: {res.text}")
-                
-                if res.status_code == 200:
-                    data = res.json()
+                try:
+                    data = self.daemon.my(iface)
+                    logger.debug(f"My info response: {json.dumps(data)}")
                     if data['status'] == 'success':
                         self._my = data['my']
                         logger.debug(f"Got my info from server: {json.dumps(self._my)}")
-                        return
+                        return True
+                except requests.RequestException as e:
+                    logger.error(f"My info request failed: {str(e)}")
                 
                 # If server fails, try local detection
                 logger.debug(f"Server my info detection failed, trying local detection...")
@@ -379,17 +615,17 @@ try:
                         'mac': self.get_mac_address(iface)
                     }
                     logger.debug(f"Using my config: {json.dumps(self._my)}")
-                    return
+                    return True
                     
                 logger.error(f"No IPv4 address found for interface {iface}")
                 self.show_error('Error', f'No IPv4 address found for interface {iface}')
-                sys.exit(1)
+                return False
                 
             except Exception as e:
                 logger.error(f"Error getting my info: {str(e)}")
                 logger.error(traceback.format_exc())
                 self.show_error('Error', f'Failed to get network info: {str(e)}')
-                sys.exit(1)
+                return False
 
         def run(self):
             logger.info("Starting main loop...")
@@ -398,6 +634,7 @@ try:
                 logger.debug("Viewport shown in run()")
                 while dpg.is_dearpygui_running():
                     try:
+                        self.poll_hosts()
                         dpg.render_dearpygui_frame()
                     except Exception as e:
                         logger.error(f"Error in render frame: {str(e)}")
@@ -407,6 +644,8 @@ try:
                 logger.error(traceback.format_exc())
             finally:
                 logger.info("Cleaning up...")
+                logger.info(f"Daemon call latency: {json.dumps(self.daemon.latency())}")
+                self.inventory.close()
                 try:
                     dpg.destroy_context()
                 except Exception as e:
@@ -0,0 +1,95 @@
+import os
+import grp
+import socket
+import logging
+from socketserver import ThreadingMixIn, TCPServer
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+from bottle import ServerAdapter
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    wsgiref server that handles every request in its own thread
+    """
+    daemon_threads = True
+
+
+class LoggingRequestHandler(WSGIRequestHandler):
+    """
+    send the access log to the server logger instead of stderr
+    """
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class ThreadedServer(ServerAdapter):
+    """
+    bottle adapter for ThreadingWSGIServer, so one slow /scan does not block /status
+    """
+    def run(self, app):
+        self.srv = make_server(self.host, self.port, app, ThreadingWSGIServer, LoggingRequestHandler)
+        self.port = self.srv.server_port
+        self.srv.serve_forever()
+
+
+class UnixWSGIServer(ThreadingWSGIServer):
+    """
+    ThreadingWSGIServer listening on a Unix domain socket path
+    """
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+        self.setup_environ()
+
+    def get_request(self):
+        conn, addr = self.socket.accept()
+        return conn, ('unix', 0)
+
+
+class UnixServer(ServerAdapter):
+    """
+    bottle adapter serving on a Unix domain socket, who may connect is
+    controlled by the socket file mode and group
+    """
+    def __init__(self, path, mode=0o660, group=None, **options):
+        super().__init__(host=path, port=0, **options)
+        self.path = path
+        self.mode = mode
+        self.group = group
+
+    def run(self, app):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        # nobody else may connect before the permissions are in place
+        umask = os.umask(0o177)
+        try:
+            self.srv = UnixWSGIServer(self.path, LoggingRequestHandler)
+        finally:
+            os.umask(umask)
+        if self.group:
+            os.chown(self.path, -1, grp.getgrnam(self.group).gr_gid)
+        os.chmod(self.path, self.mode)
+        logger.info('Listening on unix socket {}'.format(self.path))
+
+        self.srv.set_app(app)
+        try:
+            self.srv.serve_forever()
+        finally:
+            self.srv.server_close()
+            os.unlink(self.path)
+
+
+# name -> bottle server adapter, any other name bottle knows (waitress, cheroot,
+# aiohttp, ...) is passed straight to bottle
+SERVERS = {
+    'threaded': ThreadedServer,
+}
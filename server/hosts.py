@@ -0,0 +1,177 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from oui import vendors
+from presence import presence
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+def by_address(host):
+    """
+    sort key for hosts, by IPv4 address with the IPv6 only ones last
+    """
+    return not host['ip'], tuple(int(part) for part in host['ip'].split('.') if part)
+
+
+class HostTable:
+    """
+    live hosts keyed by MAC address with the time each one was last seen,
+    fed by the passive ARP listener and by active scans
+
+    every added, changed or removed host bumps the table version so clients
+    can ask for what happened since the version they already have, versions
+    only compare within one epoch, a new one starts with every daemon run
+    """
+    def __init__(self, stale_after=60, expire_after=600, max_removed=4096, vendors=None, presence=None):
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self.max_removed = max_removed
+        # OuiIndex used to name the vendor of new hosts
+        self.vendors = vendors
+        # PresenceStore that gets every sighting
+        self.presence = presence
+        self.version = 0
+        self.epoch = '{:x}'.format(time.time_ns())
+        self._hosts = dict()
+        # mac -> (version it was added at, version it last changed at)
+        self._versions = dict()
+        # mac -> version it was removed at, oldest first
+        self._removed = OrderedDict()
+        # deltas from versions before this one can't be computed any more
+        self._horizon = 0
+        self._lock = threading.Lock()
+
+    def _bump(self, mac, added=False):
+        self.version += 1
+        created = self.version if added else self._versions[mac][0]
+        self._versions[mac] = (created, self.version)
+        self._removed.pop(mac, None)
+
+    def seen(self, ip, mac, hostname=None, now=None, iface=None, ipv6=None):
+        """
+        record that mac answered for ip, on iface when known, ipv6 addresses
+        are added to the ones already known and an empty ip keeps the old one
+        """
+        now = time.time() if now is None else now
+        mac = mac.lower()
+        with self._lock:
+            host = self._hosts.get(mac)
+            if host is None:
+                host = {'ip': ip, 'mac': mac, 'hostname': hostname or '', 'iface': iface or '',
+                        'vendor': self.vendors.lookup(mac) if self.vendors else '',
+                        'ipv6': sorted(set(ipv6 or []))}
+                self._hosts[mac] = host
+                self._bump(mac, added=True)
+                logger.debug(f'New host seen: {ip} {mac}')
+            else:
+                ip = ip or host['ip']
+                addrs = sorted(set(host['ipv6']) | set(ipv6 or []))
+                if (host['ip'] != ip or (hostname and host['hostname'] != hostname) or
+                        (iface and host['iface'] != iface) or addrs != host['ipv6']):
+                    # the old hostname belonged to the old address
+                    host['hostname'] = hostname or ('' if host['ip'] != ip else host['hostname'])
+                    host['ip'] = ip
+                    host['iface'] = iface or host['iface']
+                    # a new list, so copies handed out earlier don't change
+                    host['ipv6'] = addrs
+                    self._bump(mac)
+            host['last_seen'] = now
+        if self.presence is not None:
+            self.presence.mark(mac, now)
+
+    def set_hostnames(self, names):
+        """
+        fill in resolved hostnames, names is {ip: hostname}
+        """
+        with self._lock:
+            for mac, host in self._hosts.items():
+                if names.get(host['ip']) and host['hostname'] != names[host['ip']]:
+                    host['hostname'] = names[host['ip']]
+                    self._bump(mac)
+
+    def expire(self, now=None):
+        """
+        drop hosts not seen for expire_after seconds and return them
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            gone = [mac for mac, host in self._hosts.items()
+                    if now - host['last_seen'] > self.expire_after]
+            expired = [self._hosts.pop(mac) for mac in gone]
+            for mac in gone:
+                self.version += 1
+                del self._versions[mac]
+                self._removed[mac] = self.version
+            while len(self._removed) > self.max_removed:
+                mac, self._horizon = self._removed.popitem(last=False)
+        if expired:
+            logger.debug(f'Expired {len(expired)} hosts')
+        return expired
+
+    def stale(self, now=None):
+        """
+        hosts that have not been seen for stale_after seconds
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            # IPv6 only hosts can't be re-probed with ARP
+            return [dict(host) for host in self._hosts.values()
+                    if host['ip'] and now - host['last_seen'] > self.stale_after]
+
+    def recent(self, now=None):
+        """
+        MACs of the hosts seen in the last stale_after seconds
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return {mac for mac, host in self._hosts.items() if now - host['last_seen'] <= self.stale_after}
+
+    def changes(self, since=0):
+        """
+        hosts added, changed and removed after version since, with 'full' set
+        when since is too old (or negative) and added holds the whole table instead
+        """
+        with self._lock:
+            full = since < 0 or since < self._horizon or since > self.version
+            added = list()
+            changed = list()
+            for mac, host in self._hosts.items():
+                created, updated = self._versions[mac]
+                if full or created > since:
+                    added.append(dict(host))
+                elif updated > since:
+                    changed.append(dict(host))
+            removed = [] if full else [mac for mac, version in self._removed.items() if version > since]
+            return {
+                'version': self.version,
+                'epoch': self.epoch,
+                'full': full,
+                'added': sorted(added, key=by_address),
+                'changed': changed,
+                'removed': removed
+            }
+
+    def get(self, mac):
+        """
+        a copy of the host with this MAC, None if it is not in the table
+        """
+        with self._lock:
+            host = self._hosts.get(mac.lower())
+            return dict(host) if host else None
+
+    def hosts(self):
+        """
+        all hosts by IPv4 address, the IPv6 only ones last
+        """
+        with self._lock:
+            return sorted((dict(host) for host in self._hosts.values()), key=by_address)
+
+    def __len__(self):
+        return len(self._hosts)
+
+
+host_table = HostTable(vendors=vendors, presence=presence)
@@ -0,0 +1,85 @@
+import sys
+import logging
+
+from utils import get_if_mac
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+class ArpListener:
+    """
+    passively watch ARP traffic and keep the host table up to date,
+    the 'arp' filter is compiled to BPF so the kernel drops everything else
+
+    handlers added with add_handler() get every ARP packet from other hosts
+    """
+    def __init__(self, table):
+        self.table = table
+        self.handlers = list()
+        self._sniffer = None
+        self._own_macs = set()
+        # what start() was given, [] is scapy's default interface
+        self.ifaces = list()
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    @property
+    def running(self):
+        return self._sniffer is not None and self._sniffer.running
+
+    def start(self, ifaces=None):
+        """
+        sniff on one interface name or a list of them
+        """
+        if self.running:
+            return
+        if isinstance(ifaces, str):
+            ifaces = [ifaces]
+        try:
+            from scapy.sendrecv import AsyncSniffer
+            import scapy.layers.l2  # so captured frames are dissected down to ARP
+            if ifaces:
+                self._own_macs = {get_if_mac(iface) for iface in ifaces}
+            self._sniffer = AsyncSniffer(iface=ifaces, filter='arp', prn=self._on_packet, store=False)
+            self._sniffer.start()
+            self.ifaces = sorted(ifaces or [])
+            logger.info('ARP listener started on {}'.format(', '.join(ifaces) if ifaces else 'the default interface'))
+        except Exception as e:
+            self._sniffer = None
+            logger.error(sys.exc_info()[1], exc_info=True)
+
+    def stop(self):
+        if self.running:
+            self._sniffer.stop()
+        self._sniffer = None
+        self.ifaces = list()
+
+    def retarget(self, ifaces):
+        """
+        sniff on ifaces from now on, restarting only if they changed
+        """
+        if self.running and self.ifaces == sorted(ifaces):
+            return
+        logger.info('Moving the ARP listener to {}'.format(', '.join(ifaces) or 'nothing'))
+        self.stop()
+        if ifaces:
+            self.start(ifaces)
+
+    def _on_packet(self, pkt):
+        from scapy.layers.l2 import ARP
+        try:
+            if ARP not in pkt:
+                return
+            arp = pkt[ARP]
+            # skip address probes and our own frames, which include the spoofed replies for cut hosts,
+            # the MAC is read now since /change-mac may have replaced it after start()
+            own_macs = {get_if_mac(pkt.sniffed_on)} if pkt.sniffed_on else self._own_macs
+            if arp.psrc == '0.0.0.0' or arp.hwsrc.lower() in own_macs:
+                return
+            self.table.seen(arp.psrc, arp.hwsrc, iface=pkt.sniffed_on)
+            for handler in self.handlers:
+                handler(pkt)
+        except Exception as e:
+            logger.error(sys.exc_info()[1], exc_info=True)
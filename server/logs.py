@@ -0,0 +1,120 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+
+LOG_DIR = '/var/log/tuxcut'
+LOG_FILE = 'tuxcut.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# records waiting for the writer thread, more than this and new ones are dropped
+QUEUE_SIZE = 10000
+
+logger = logging.getLogger('tuxcut-server')
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full instead of
+    blocking the caller or printing an error for every record
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    loggers only put records on a queue, a background thread does the disk
+    and console writes, so a slow disk never holds up the packet paths
+    """
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self.path = ''
+
+    def start(self, level='INFO', log_dir=LOG_DIR, max_bytes=5 * 1024 * 1024, backups=5, when=None):
+        """
+        rotate the log file once it reaches max_bytes, or at every when
+        ('midnight', 'h', ...) if given, keeping backups old files
+        """
+        if self.listener is not None:
+            return
+        handlers = [logging.StreamHandler(sys.stderr)]
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            log_file = Path(os.path.join(log_dir, LOG_FILE))
+            if not log_file.exists():
+                log_file.touch()
+                log_file.chmod(0o666)
+            if when:
+                handlers.append(TimedRotatingFileHandler(str(log_file), when=when, backupCount=backups))
+            else:
+                handlers.append(RotatingFileHandler(str(log_file), maxBytes=max_bytes, backupCount=backups))
+            self.path = str(log_file)
+        except OSError as e:
+            print('Logging to the console only, {}'.format(e), file=sys.stderr)
+        formatter = logging.Formatter(LOG_FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        self.handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        self.listener = QueueListener(self.handler.queue, *handlers)
+        self.listener.start()
+        atexit.register(self.stop)
+
+        # our own records at the chosen level, other libraries only warnings and up
+        logger.setLevel(level)
+        logger.propagate = False
+        logger.addHandler(self.handler)
+        root = logging.getLogger()
+        root.setLevel(logging.WARNING)
+        root.addHandler(self.handler)
+
+    def stop(self):
+        """
+        write out what is still queued and stop the writer thread
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler else 0
+
+
+log_pipeline = LogPipeline()
+
+
+def setup_logging(**kwargs):
+    log_pipeline.start(**kwargs)
+
+
+def get_levels():
+    """
+    {logger name: level name} for the tuxcut logger and the ones set through set_level
+    """
+    names = ['tuxcut-server'] + [name for name in logging.root.manager.loggerDict
+                                 if name != 'tuxcut-server' and logging.getLogger(name).level]
+    return {name: logging.getLevelName(logging.getLogger(name).getEffectiveLevel()) for name in sorted(names)}
+
+
+def set_level(level, name='tuxcut-server'):
+    """
+    change the level of a logger at runtime, raises ValueError for an unknown level
+    """
+    level = str(level).upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError('unknown log level {}'.format(level))
+    logging.getLogger(name).setLevel(level)
+    logger.info('Log level of {} set to {}'.format(name, level))
@@ -0,0 +1,144 @@
+import math
+import time
+import threading
+
+
+class Metric:
+    """
+    base for the metric types, samples are kept per tuple of label values
+    """
+    kind = ''
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_text(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"'))
+                              for name, value in pairs) + '}'
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, '', self.function())]
+        with self._lock:
+            return [(self.name, self._label_text(key), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines += ['{}{} {}'.format(name, labels, format_value(value)) for name, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                                      0.5, 1, 2.5, 5, 10, 30)):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = list()
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    le = '+Inf' if bound == math.inf else format_value(bound)
+                    samples.append((self.name + '_bucket', self._label_text(key, ('le', le)), count))
+                samples.append((self.name + '_sum', self._label_text(key), total))
+                samples.append((self.name + '_count', self._label_text(key), counts[-1]))
+        return samples
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = list()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        all metrics in the Prometheus text exposition format
+        """
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+scan_duration = registry.register(Histogram(
+    'tuxcut_scan_duration_seconds', 'Time spent in each scan phase', labels=('phase',)))
+hosts_found = registry.register(Gauge(
+    'tuxcut_scan_hosts_found', 'Hosts found by the last scan'))
+packets_sent = registry.register(Counter(
+    'tuxcut_packets_sent_total', 'Packets sent', labels=('kind',)))
+packets_received = registry.register(Counter(
+    'tuxcut_packets_received_total', 'Packets received in reply to our probes', labels=('kind',)))
+request_duration = registry.register(Histogram(
+    'tuxcut_http_request_duration_seconds', 'Time to handle an API request', labels=('route', 'method')))
+job_lag = registry.register(Histogram(
+    'tuxcut_job_lag_seconds', 'Delay between a job\'s scheduled and actual start', labels=('job',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)))
+job_duration = registry.register(Histogram(
+    'tuxcut_job_duration_seconds', 'Background job run time', labels=('job',)))
+jobs_missed = registry.register(Counter(
+    'tuxcut_jobs_missed_total', 'Background job runs skipped because they were too late', labels=('job',)))
+
+
+class RequestTimer:
+    """
+    bottle plugin that records how long every route takes to answer
+    """
+    name = 'request_timer'
+    api = 2
+
+    def apply(self, callback, route):
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                request_duration.observe(time.monotonic() - start, route=route.rule, method=route.method)
+        return wrapper
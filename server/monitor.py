@@ -0,0 +1,95 @@
+import time
+import logging
+import threading
+from collections import deque
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+class ArpGuard:
+    """
+    track the IP to MAC bindings announced in ARP traffic and raise events for
+    conflicting or gratuitous replies, a new MAC for the gateway is critical
+    """
+    def __init__(self, max_events=256, repeat_after=60):
+        self.repeat_after = repeat_after
+        self._gateway = dict()
+        self._bindings = dict()
+        self._events = deque(maxlen=max_events)
+        self._last_id = 0
+        # (kind, ip, mac) -> when it was last reported, so a flood is one event a minute
+        self._reported = dict()
+        self._lock = threading.Lock()
+
+    def set_gateway(self, gw):
+        """
+        trust gw['mac'] as the real MAC of gw['ip']
+        """
+        if gw.get('ip') and gw.get('mac'):
+            with self._lock:
+                self._gateway = {'ip': gw['ip'], 'mac': gw['mac'].lower()}
+                self._bindings[gw['ip']] = gw['mac'].lower()
+
+    def observe(self, pkt):
+        """
+        ArpListener handler, check one ARP packet against the known bindings
+        """
+        from scapy.layers.l2 import ARP, Ether
+        arp = pkt[ARP]
+        ip = arp.psrc
+        mac = arp.hwsrc.lower()
+        is_reply = arp.op == 2
+        gratuitous = is_reply and (arp.pdst == arp.psrc or
+                                   (Ether in pkt and pkt[Ether].dst == 'ff:ff:ff:ff:ff:ff'))
+
+        with self._lock:
+            previous = self._bindings.get(ip)
+            if ip == self._gateway.get('ip') and mac != self._gateway['mac']:
+                self._report('gateway-spoof', 'critical', ip, mac, self._gateway['mac'],
+                             f'{mac} claims to be the gateway {ip} ({self._gateway["mac"]})')
+                # keep trusting the gateway MAC we know
+                return
+            if previous and previous != mac:
+                self._report('conflict', 'warning', ip, mac, previous,
+                             f'{ip} moved from {previous} to {mac}')
+            elif gratuitous:
+                self._report('gratuitous', 'info', ip, mac, previous,
+                             f'gratuitous ARP reply from {mac} for {ip}')
+            self._bindings[ip] = mac
+
+    def _report(self, kind, severity, ip, mac, previous, msg):
+        now = time.time()
+        key = (kind, ip, mac)
+        if now - self._reported.get(key, 0) < self.repeat_after:
+            return
+        self._reported[key] = now
+        if len(self._reported) > 4096:
+            self._reported = {key: when for key, when in self._reported.items()
+                              if now - when < self.repeat_after}
+        self._last_id += 1
+        self._events.append({
+            'id': self._last_id,
+            'time': now,
+            'kind': kind,
+            'severity': severity,
+            'ip': ip,
+            'mac': mac,
+            'previous_mac': previous or '',
+            'msg': msg
+        })
+        if severity == 'info':
+            logger.info(f'ARP monitor: {msg}')
+        else:
+            logger.warning(f'ARP monitor: {msg}')
+
+    def events(self, since=0):
+        """
+        the events with an id after since, oldest first
+        """
+        with self._lock:
+            return [dict(event) for event in self._events if event['id'] > since]
+
+    @property
+    def last_id(self):
+        return self._last_id
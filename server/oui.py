@@ -0,0 +1,183 @@
+"""
+vendor names for MAC addresses from a precompiled OUI index
+
+the index is a header followed by fixed width records sorted by OUI, so it
+is memory-mapped as is and binary-searched without parsing anything:
+
+    header  magic b'OUI1', record count (uint32 LE), record size (uint32 LE)
+    record  3 byte OUI, vendor name in UTF-8 padded with NUL bytes
+
+build it from the IEEE registry (https://standards-oui.ieee.org/oui/oui.csv)
+or a Wireshark manuf file with
+
+    python3 server/oui.py build oui.csv oui.bin
+"""
+import os
+import sys
+import csv
+import mmap
+import struct
+import logging
+import argparse
+import threading
+
+
+logger = logging.getLogger('tuxcut-server')
+
+MAGIC = b'OUI1'
+HEADER = struct.Struct('<4sII')
+RECORD_SIZE = 32
+# first match wins, the package installs it next to the binaries
+OUI_PATHS = [
+    os.environ.get('TUXCUT_OUI', ''),
+    '/opt/tuxcut/oui.bin',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'oui.bin'),
+]
+
+
+def mac_prefix(mac):
+    """
+    the first 3 bytes of mac, None for randomized (locally administered) addresses
+    """
+    digits = mac.replace(':', '').replace('-', '').replace('.', '')
+    try:
+        prefix = bytes.fromhex(digits[:6])
+    except ValueError:
+        return None
+    if len(prefix) != 3 or prefix[0] & 0x02:
+        return None
+    return prefix
+
+
+class OuiIndex:
+    """
+    read-only view of an OUI index file, it is mapped on the first lookup
+    """
+    def __init__(self, paths=OUI_PATHS):
+        self.paths = [path for path in paths if path]
+        self.path = ''
+        self.count = 0
+        self._map = None
+        self._record_size = RECORD_SIZE
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                path = next((path for path in self.paths if os.path.isfile(path)), None)
+                if path is None:
+                    logger.info('No OUI index found, vendors will be empty')
+                    return
+                with open(path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count, record_size = HEADER.unpack_from(mapped)
+                if magic != MAGIC or HEADER.size + count * record_size > len(mapped):
+                    raise ValueError('{} is not an OUI index'.format(path))
+                self._map, self.count, self._record_size, self.path = mapped, count, record_size, path
+                logger.info('Loaded {} vendors from {}'.format(count, path))
+            except Exception as e:
+                logger.error(sys.exc_info()[1], exc_info=True)
+            finally:
+                # lookups that don't take the lock only see _loaded once _map is in place
+                self._loaded = True
+
+    def lookup(self, mac):
+        """
+        the vendor of mac, '' when unknown
+        """
+        if not self._loaded:
+            self._load()
+        prefix = mac_prefix(mac)
+        if self._map is None or prefix is None:
+            return ''
+        mapped, size = self._map, self._record_size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * size
+            key = mapped[offset:offset + 3]
+            if key < prefix:
+                lo = mid + 1
+            elif key > prefix:
+                hi = mid
+            else:
+                return mapped[offset + 3:offset + size].rstrip(b'\0').decode('utf-8', 'replace')
+        return ''
+
+    def lookup_many(self, macs):
+        """
+        {mac: vendor} for a list of MAC addresses
+        """
+        return {mac: self.lookup(mac) for mac in macs}
+
+
+vendors = OuiIndex()
+
+
+def read_source(path):
+    """
+    (oui bytes, vendor) pairs from an IEEE oui.csv or a Wireshark manuf file,
+    only whole /24 assignments are kept
+    """
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        first = f.readline()
+        f.seek(0)
+        if first.startswith('Registry,'):
+            for row in csv.DictReader(f):
+                if len(row['Assignment']) == 6:
+                    yield bytes.fromhex(row['Assignment']), row['Organization Name'].strip()
+            return
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2 or '/' in fields[0]:
+                continue
+            # prefer the long name when the file has one
+            name = fields[2] if len(fields) > 2 and fields[2].strip() else fields[1]
+            prefix = fields[0].replace(':', '').replace('-', '')
+            if len(prefix) == 6:
+                yield bytes.fromhex(prefix), name.strip()
+
+
+def build_index(source, dest, record_size=RECORD_SIZE):
+    """
+    compile source into the fixed width index at dest, returns the record count
+    """
+    width = record_size - 3
+    records = dict()
+    for prefix, name in read_source(source):
+        encoded = name.encode('utf-8')[:width]
+        # don't cut a multi-byte character in half
+        records[prefix] = encoded.decode('utf-8', 'ignore').encode('utf-8').ljust(width, b'\0')
+
+    tmp = dest + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), record_size))
+        for prefix in sorted(records):
+            f.write(prefix + records[prefix])
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, dest)
+    return len(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TuxCut OUI vendor index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='compile oui.csv or a manuf file into an index')
+    build.add_argument('source')
+    build.add_argument('dest', nargs='?', default='oui.bin')
+    lookup = commands.add_parser('lookup', help='look MAC addresses up in an index')
+    lookup.add_argument('--index', default=None)
+    lookup.add_argument('macs', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print('{} vendors written to {}'.format(build_index(args.source, args.dest), args.dest))
+    else:
+        index = OuiIndex([args.index] if args.index else OUI_PATHS)
+        for mac, vendor in index.lookup_many(args.macs).items():
+            print('{}\t{}'.format(mac, vendor or '-'))
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import struct
+import logging
+import threading
+
+
+logger = logging.getLogger('tuxcut-server')
+
+STATE_DIR = '/var/lib/tuxcut'
+# one week of hours and three months of days per host
+HOURS = 168
+DAYS = 90
+
+MAGIC = b'PRS1'
+HEADER = struct.Struct('<4sIII')
+ENTRY = struct.Struct('<6sqQ{}s{}s'.format(HOURS, DAYS))
+
+
+class Timeline:
+    """
+    presence of one host: a bit per minute of the current hour, the minutes
+    seen in each of the last HOURS hours and the hours seen in each of the
+    last DAYS days, both rings indexed by the absolute hour or day number
+    """
+    __slots__ = ('hour', 'minutes', 'hourly', 'daily')
+
+    def __init__(self, hour, minutes=0, hourly=None, daily=None):
+        self.hour = hour
+        self.minutes = minutes
+        self.hourly = bytearray(hourly or HOURS)
+        self.daily = bytearray(daily or DAYS)
+
+    def advance(self, hour):
+        """
+        close the current hour and clear the slots of the hours and days
+        that passed since, so the rings never hold stale data
+        """
+        if hour <= self.hour:
+            return
+        seen = bin(self.minutes).count('1')
+        self.hourly[self.hour % HOURS] = seen
+        if seen:
+            self.daily[self.hour // 24 % DAYS] += 1
+        for h in range(self.hour + 1, min(hour, self.hour + HOURS) + 1):
+            self.hourly[h % HOURS] = 0
+        day = self.hour // 24
+        for d in range(day + 1, min(hour // 24, day + DAYS) + 1):
+            self.daily[d % DAYS] = 0
+        self.hour = hour
+        self.minutes = 0
+
+    def mark(self, now):
+        self.advance(int(now // 3600))
+        self.minutes |= 1 << int(now % 3600 // 60)
+
+    def last_hours(self, count):
+        """
+        minutes seen per hour, oldest first, the last one is the current hour
+        """
+        count = min(count, HOURS)
+        values = [self.hourly[h % HOURS] for h in range(self.hour - count + 1, self.hour)]
+        return values + [bin(self.minutes).count('1')]
+
+    def last_days(self, count):
+        """
+        hours seen per day, oldest first, the last one is today so far
+        """
+        count = min(count, DAYS)
+        day = self.hour // 24
+        values = [self.daily[d % DAYS] for d in range(day - count + 1, day + 1)]
+        if self.minutes:
+            values[-1] += 1
+        return values
+
+
+class PresenceStore:
+    """
+    when each host was online, fed by every ARP reply and scan result,
+    with a fixed size per host and at most max_hosts hosts
+    """
+    def __init__(self, path=os.path.join(STATE_DIR, 'presence.bin'), max_hosts=4096):
+        self.path = path
+        self.max_hosts = max_hosts
+        self._timelines = dict()
+        self._lock = threading.Lock()
+
+    def mark(self, mac, now=None):
+        """
+        record that mac was seen at now
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            timeline = self._timelines.get(mac)
+            if timeline is None:
+                if len(self._timelines) >= self.max_hosts:
+                    oldest = min(self._timelines, key=lambda key: self._timelines[key].hour)
+                    del self._timelines[oldest]
+                timeline = self._timelines[mac] = Timeline(int(now // 3600))
+            timeline.mark(now)
+
+    def hourly(self, hours=24, macs=None, now=None):
+        """
+        {mac: minutes seen per hour over the last hours hours}
+        """
+        return self._query(lambda timeline: timeline.last_hours(hours), macs, now)
+
+    def daily(self, days=7, macs=None, now=None):
+        """
+        {mac: hours seen per day over the last days days}
+        """
+        return self._query(lambda timeline: timeline.last_days(days), macs, now)
+
+    def _query(self, values, macs, now):
+        hour = int((time.time() if now is None else now) // 3600)
+        with self._lock:
+            result = dict()
+            for mac in self._timelines if macs is None else macs:
+                timeline = self._timelines.get(mac)
+                if timeline is not None:
+                    timeline.advance(hour)
+                    result[mac] = values(timeline)
+            return result
+
+    def __len__(self):
+        return len(self._timelines)
+
+    def save(self):
+        """
+        write every timeline to path, atomically
+        """
+        with self._lock:
+            data = [HEADER.pack(MAGIC, len(self._timelines), HOURS, DAYS)]
+            data += [ENTRY.pack(bytes.fromhex(mac.replace(':', '')), timeline.hour, timeline.minutes,
+                                bytes(timeline.hourly), bytes(timeline.daily))
+                     for mac, timeline in self._timelines.items()]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(b''.join(data))
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.error(sys.exc_info()[1], exc_info=True)
+
+    def load(self):
+        """
+        read the timelines saved by save(), a missing or foreign file is ignored
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        try:
+            magic, count, hours, days = HEADER.unpack_from(data)
+            if magic != MAGIC or (hours, days) != (HOURS, DAYS):
+                logger.info('Ignoring presence data in an old format')
+                return
+            timelines = dict()
+            for i in range(min(count, self.max_hosts)):
+                raw_mac, hour, minutes, hourly, daily = ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)
+                mac = ':'.join('{:02x}'.format(byte) for byte in raw_mac)
+                timelines[mac] = Timeline(hour, minutes, hourly, daily)
+            with self._lock:
+                self._timelines = timelines
+            logger.info('Loaded presence of {} hosts'.format(len(timelines)))
+        except struct.error:
+            logger.error(sys.exc_info()[1], exc_info=True)
+
+
+presence = PresenceStore()
@@ -0,0 +1,142 @@
+import socket
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+class TTLCache:
+    """
+    bounded LRU cache whose entries also expire after a time-to-live
+    """
+    def __init__(self, maxsize=4096, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        return (found, value), dropping the entry if it has expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class HostnameResolver:
+    """
+    resolve PTR names in a thread pool instead of forking a process per lookup,
+    results (including failures) are kept in a shared TTL cache
+    """
+    def __init__(self, workers=32, timeout=1.0, ttl=600, negative_ttl=60, maxsize=4096):
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='resolver')
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, ip):
+        try:
+            return socket.gethostbyaddr(ip)[0]
+        except (socket.herror, socket.gaierror, OSError):
+            return ''
+
+    def _on_done(self, ip, future):
+        name = '' if future.exception() else future.result()
+        self._cache.set(ip, name, ttl=None if name else self.negative_ttl)
+        with self._lock:
+            self._pending.pop(ip, None)
+
+    def _submit(self, ip):
+        """
+        start a lookup for ip, sharing any lookup already in flight
+        """
+        with self._lock:
+            future = self._pending.get(ip)
+            if future is None:
+                future = self._pool.submit(self._lookup, ip)
+                self._pending[ip] = future
+                future.add_done_callback(lambda f: self._on_done(ip, f))
+        return future
+
+    def prefetch(self, ips):
+        """
+        start lookups for ips that are not cached yet without waiting for them
+        """
+        for ip in ips:
+            found, name = self._cache.get(ip)
+            if not found:
+                self._submit(ip)
+
+    def resolve_many(self, ips, timeout=None):
+        """
+        resolve all the given ips concurrently and return {ip: hostname},
+        lookups that miss the deadline give '' now and are cached when they finish
+        """
+        results = dict()
+        futures = dict()
+        for ip in set(ips):
+            found, name = self._cache.get(ip)
+            if found:
+                self.hits += 1
+                results[ip] = name
+            else:
+                self.misses += 1
+                futures[ip] = self._submit(ip)
+
+        if futures:
+            wait(futures.values(), timeout=self.timeout if timeout is None else timeout)
+            for ip, future in futures.items():
+                if future.done() and not future.exception():
+                    results[ip] = future.result()
+                else:
+                    logger.debug(f'Hostname lookup for {ip} missed the deadline')
+                    results[ip] = ''
+        return results
+
+    def resolve(self, ip, timeout=None):
+        return self.resolve_many([ip], timeout=timeout).get(ip, '')
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def cached(self):
+        return len(self._cache)
+
+    def invalidate(self):
+        self._cache.clear()
+
+
+# shared by /scan, /gw and /my so refreshes reuse earlier answers
+hostnames = HostnameResolver()
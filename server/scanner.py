@@ -0,0 +1,595 @@
+import sys
+import time
+import queue
+import socket
+import logging
+import ipaddress
+import threading
+from threading import Thread
+import netifaces
+
+from utils import get_if_mac, IFF_UP, IFF_LOOPBACK
+from metrics import scan_duration, packets_sent, packets_received
+
+
+logger = logging.getLogger('tuxcut-server')
+
+
+# ARP requests per second, override per scan with ?rate= up to MAX_PROBE_RATE
+PROBE_RATE = 512
+MAX_PROBE_RATE = 8192
+# requests handed to the kernel before pausing to keep the rate
+CHUNK_SIZE = 64
+# seconds to keep collecting late replies after the last chunk
+REPLY_TIMEOUT = 2
+# never sweep more than a /16 in one go
+MIN_PREFIX = 16
+# seconds to collect IPv6 neighbour discovery answers, it runs next to the ARP sweep
+NDP_TIMEOUT = 1.5
+# sweep a segment at most this often, scans in between start from the kernel
+# neighbour table and only probe the addresses it is unsure about
+FULL_SWEEP_INTERVAL = 300
+# neighbour states the kernel confirmed recently, they are taken without a probe
+CONFIRMED_STATES = ('reachable', 'permanent')
+
+# when each interface was last swept, time.monotonic()
+last_sweeps = dict()
+
+
+def find_iface(ip):
+    """
+    the interface that owns ip or whose subnet contains it
+    """
+    addr = ipaddress.ip_address(ip)
+    for iface in netifaces.interfaces():
+        network = get_iface_network(iface)
+        if network and (network.ip == addr or addr in network.network):
+            return iface
+    return None
+
+
+def default_iface():
+    """
+    the interface of the default IPv4 route
+    """
+    default = netifaces.gateways()['default'].get(netifaces.AF_INET)
+    return default[1] if default else None
+
+
+def scan_ifaces():
+    """
+    every interface that is up with a carrier, is not loopback and has an
+    IPv4 subnet to sweep
+    """
+    ifaces = list()
+    for iface in netifaces.interfaces():
+        try:
+            with open('/sys/class/net/{}/flags'.format(iface)) as f:
+                flags = int(f.read(), 16)
+            # reading carrier fails while the interface is down
+            with open('/sys/class/net/{}/carrier'.format(iface)) as f:
+                if f.read().strip() != '1':
+                    continue
+        except (OSError, ValueError):
+            continue
+        network = get_iface_network(iface)
+        if flags & IFF_UP and not flags & IFF_LOOPBACK and network and network.network.prefixlen < 31:
+            ifaces.append(iface)
+    return ifaces
+
+
+def get_if_link_local(iface):
+    """
+    the fe80:: address of iface, '' if it has none
+    """
+    for addr in netifaces.ifaddresses(iface).get(netifaces.AF_INET6, []):
+        ip = addr['addr'].split('%')[0]
+        if ip.startswith('fe80:'):
+            return ip
+    return ''
+
+
+def kernel_neighbours(iface, family=socket.AF_INET):
+    """
+    (ip, mac, state) for the resolved entries of the kernel neighbour table of
+    iface, read with one RTM_GETNEIGH dump, state is 'reachable', 'stale', ...
+
+    IPv4 falls back to /proc/net/arp when netlink is not available, without
+    states those entries all count as stale
+    """
+    try:
+        from pyroute2 import IPRoute
+        from pyroute2.netlink.rtnl.ndmsg import states
+        names = {value: name for name, value in states.items()}
+        with IPRoute() as ipr:
+            index = ipr.link_lookup(ifname=iface)
+            if not index:
+                return list()
+            entries = list()
+            for neigh in ipr.get_neighbours(family=family, ifindex=index[0]):
+                ip, mac = neigh.get_attr('NDA_DST'), neigh.get_attr('NDA_LLADDR')
+                state = names.get(neigh['state'], 'none')
+                # incomplete and failed entries have no usable MAC, noarp ones are multicast
+                if ip and mac and state not in ('incomplete', 'failed', 'noarp', 'none'):
+                    entries.append((ip, mac.lower(), state))
+            return entries
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+        if family != socket.AF_INET:
+            return list()
+        return [(ip, mac.lower(), 'stale') for ip, mac in read_arp_cache(iface).items()]
+
+
+def sweep_due(iface):
+    """
+    True when iface was never swept or not in the last FULL_SWEEP_INTERVAL seconds
+    """
+    last = last_sweeps.get(iface)
+    return last is None or time.monotonic() - last >= FULL_SWEEP_INTERVAL
+
+
+def get_iface_network(iface):
+    """
+    the IPv4 address of iface with its netmask as an IPv4Interface
+    """
+    try:
+        addrs = netifaces.ifaddresses(iface).get(netifaces.AF_INET)
+    except ValueError:
+        return None
+    if not addrs or not addrs[0].get('netmask'):
+        return None
+    return ipaddress.IPv4Interface('{}/{}'.format(addrs[0]['addr'], addrs[0]['netmask']))
+
+
+def scan_targets(network):
+    """
+    every host address in the subnet of network except our own
+    """
+    if network.network.prefixlen < MIN_PREFIX:
+        logger.info(f'Subnet {network.network} is too large, limiting the sweep to /{MIN_PREFIX}')
+        network = ipaddress.IPv4Interface(f'{network.ip}/{MIN_PREFIX}')
+    return [str(ip) for ip in network.network.hosts() if ip != network.ip]
+
+
+class ArpSender:
+    """
+    sends who-has requests for a list of addresses over one L2 socket
+    """
+    def __init__(self, iface):
+        from scapy.config import conf
+        import scapy.sendrecv  # picks conf.L2socket for this platform
+        self.src_mac = get_if_mac(iface)
+        self.sock = conf.L2socket(iface=iface)
+
+    def send(self, ips):
+        from scapy.layers.l2 import Ether, ARP
+        for ip in ips:
+            self.sock.send(Ether(src=self.src_mac, dst='ff:ff:ff:ff:ff:ff')/ARP(hwsrc=self.src_mac, pdst=ip))
+
+    def close(self):
+        self.sock.close()
+
+
+class ScapyIO:
+    """
+    packet I/O for the scanner on a real interface, the benchmarks swap
+    packet_io for a simulated network with the same methods
+    """
+    def listen_arp_replies(self, iface, callback):
+        """
+        call callback(ip, mac) for every ARP reply until the returned stop() is called
+        """
+        from scapy.layers.l2 import ARP
+        from scapy.sendrecv import AsyncSniffer
+        started = threading.Event()
+
+        def on_reply(pkt):
+            if ARP in pkt and pkt[ARP].op == 2:
+                callback(pkt[ARP].psrc, pkt[ARP].hwsrc)
+
+        sniffer = AsyncSniffer(iface=iface, filter='arp and arp[6:2] = 2', prn=on_reply,
+                               store=False, started_callback=started.set)
+        sniffer.start()
+        started.wait(timeout=1)
+        return sniffer.stop
+
+    def open_arp_sender(self, iface):
+        return ArpSender(iface)
+
+    def ping(self, iface, ips, rate, timeout=2):
+        """
+        the addresses that answered an ICMP echo request
+        """
+        from scapy.layers.inet import IP, ICMP
+        from scapy.sendrecv import sr
+        ans, unans = sr(IP(dst=ips)/ICMP(), timeout=timeout, inter=1.0 / rate, verbose=False)
+        return {rcv.src for snd, rcv in ans}
+
+    def arp_exchange(self, iface, ips, timeout=1, macs=None):
+        """
+        one batched ARP exchange for ips, unicast to the MAC in macs when given,
+        returns the (ip, mac) answers
+        """
+        from scapy.layers.l2 import Ether, ARP
+        from scapy.sendrecv import srp
+        macs = macs or dict()
+        pkts = [Ether(dst=macs.get(ip, 'ff:ff:ff:ff:ff:ff'))/ARP(pdst=ip) for ip in ips]
+        ans, unans = srp(pkts, iface=iface, timeout=timeout, verbose=False)
+        return [(rcv.psrc, rcv.hwsrc) for snd, rcv in ans]
+
+    def arp_cache(self, iface):
+        return read_arp_cache(iface)
+
+    def neighbours(self, iface, family=socket.AF_INET):
+        return kernel_neighbours(iface, family)
+
+    def ndp_discover(self, iface, timeout=NDP_TIMEOUT):
+        """
+        ping the all-nodes multicast address and send neighbour solicitations for
+        the IPv6 neighbours the kernel knows, returns the (ipv6, mac) that answered
+        """
+        from scapy.config import conf
+        from scapy.layers.l2 import Ether
+        from scapy.layers.inet6 import (IPv6, ICMPv6EchoRequest, ICMPv6EchoReply, ICMPv6ND_NS,
+                                        ICMPv6ND_NA, ICMPv6NDOptSrcLLAddr, in6_getnsma, in6_getnsmac)
+        from scapy.sendrecv import AsyncSniffer
+
+        src_mac = get_if_mac(iface)
+        src_ip = get_if_link_local(iface)
+        if not src_ip:
+            return list()
+        found = set()
+        started = threading.Event()
+
+        def on_packet(pkt):
+            if IPv6 not in pkt or Ether not in pkt or pkt[Ether].src.lower() == src_mac:
+                return
+            mac = pkt[Ether].src.lower()
+            if ICMPv6ND_NA in pkt:
+                found.add((pkt[ICMPv6ND_NA].tgt, mac))
+            elif (ICMPv6EchoReply in pkt or ICMPv6ND_NS in pkt) and pkt[IPv6].src != '::':
+                # hosts resolving our address to answer the ping give themselves away too
+                found.add((pkt[IPv6].src, mac))
+
+        sniffer = AsyncSniffer(iface=iface, filter='icmp6', prn=on_packet, store=False,
+                               started_callback=started.set)
+        sniffer.start()
+        started.wait(timeout=1)
+        try:
+            pkts = [Ether(src=src_mac, dst='33:33:00:00:00:01')/IPv6(src=src_ip, dst='ff02::1')/ICMPv6EchoRequest()]
+            for ip, mac, state in kernel_neighbours(iface, socket.AF_INET6):
+                nsma = in6_getnsma(socket.inet_pton(socket.AF_INET6, ip))
+                pkts.append(Ether(src=src_mac, dst=in6_getnsmac(nsma)) /
+                            IPv6(src=src_ip, dst=socket.inet_ntop(socket.AF_INET6, nsma)) /
+                            ICMPv6ND_NS(tgt=ip)/ICMPv6NDOptSrcLLAddr(lladdr=src_mac))
+            sock = conf.L2socket(iface=iface)
+            try:
+                for pkt in pkts:
+                    sock.send(pkt)
+            finally:
+                sock.close()
+            packets_sent.inc(len(pkts), kind='ndp')
+            time.sleep(timeout)
+        finally:
+            sniffer.stop()
+        packets_received.inc(len(found), kind='ndp')
+        return sorted(found)
+
+
+packet_io = ScapyIO()
+
+
+def arp_sweep(iface, targets, rate=PROBE_RATE, chunk_size=None, timeout=None, io=None):
+    """
+    send who-has requests for targets in paced chunks and yield (ip, mac)
+    for every reply as soon as it arrives
+    """
+    if rate <= 0:
+        raise ValueError('rate must be positive, got {}'.format(rate))
+    io = io or packet_io
+    chunk_size = chunk_size or CHUNK_SIZE
+    timeout = REPLY_TIMEOUT if timeout is None else timeout
+    replies = queue.Queue()
+    wanted = set(targets)
+    finished = threading.Event()
+
+    def on_reply(ip, mac):
+        if ip in wanted:
+            replies.put((ip, mac))
+
+    def send_chunks():
+        try:
+            sender = io.open_arp_sender(iface)
+            try:
+                begin = time.monotonic()
+                for i in range(0, len(targets), chunk_size):
+                    chunk = targets[i:i + chunk_size]
+                    sender.send(chunk)
+                    packets_sent.inc(len(chunk), kind='arp')
+                    # sleep until the average rate is back on schedule
+                    delay = begin + (i + chunk_size) / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            finally:
+                sender.close()
+        except Exception as e:
+            logger.error(sys.exc_info()[1], exc_info=True)
+        finally:
+            finished.set()
+
+    stop = io.listen_arp_replies(iface, on_reply)
+    Thread(target=send_chunks, daemon=True).start()
+
+    seen = set()
+    deadline = None
+    try:
+        while True:
+            if deadline is None and finished.is_set():
+                deadline = time.monotonic() + timeout
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                ip, mac = replies.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            packets_received.inc(kind='arp')
+            if ip not in seen:
+                seen.add(ip)
+                yield ip, mac
+    finally:
+        stop()
+
+
+def read_arp_cache(iface=None):
+    """
+    complete entries of the kernel neighbour table as {ip: mac}
+    """
+    entries = dict()
+    try:
+        with open('/proc/net/arp') as arp_cache:
+            next(arp_cache)
+            for line in arp_cache:
+                ip, hw_type, flags, mac, mask, device = line.split()
+                # ATF_COM, the entry has a resolved hardware address
+                if int(flags, 16) & 0x2 and (iface is None or device == iface):
+                    entries[ip] = mac
+    except (OSError, ValueError):
+        logger.error(sys.exc_info()[1], exc_info=True)
+    return entries
+
+
+def resolve_macs(iface, ips, timeout=1, io=None):
+    """
+    yield (ip, mac) for ips, taking what the kernel already knows and asking
+    for the rest in one batched ARP exchange
+    """
+    io = io or packet_io
+    known = io.arp_cache(iface)
+    missing = list()
+    for ip in ips:
+        if ip in known:
+            yield ip, known[ip]
+        else:
+            missing.append(ip)
+
+    if missing:
+        ans = io.arp_exchange(iface, missing, timeout=timeout)
+        packets_sent.inc(len(missing), kind='arp')
+        packets_received.inc(len(ans), kind='arp')
+        yield from ans
+
+
+def iter_scan(gw_ip, rate=PROBE_RATE, iface=None, network=None, io=None, fallback=True, ipv6=True,
+              full=True, known=None, fresh=None):
+    """
+    hosts on the subnet of the interface that owns gw_ip, yielded without
+    hostnames as they are found
+
+    the kernel neighbour table goes first: entries it confirmed recently are
+    yielded right away without sending anything. With full=True the rest of
+    the subnet is swept with ARP, falling back to ICMP when nobody answers.
+    With full=None that sweep only happens when sweep_due(), otherwise just
+    the stale table entries and the known hosts (ip, mac dicts) the table
+    misses get one unicast ARP request each. Stale entries whose MAC is in
+    fresh were heard from lately anyway and are left alone, our own probes
+    never move a kernel entry back to REACHABLE
+
+    IPv6 neighbour discovery runs next to a sweep, or is read from the kernel
+    table when there is none, every host with IPv6 addresses is yielded again
+    at the end with its 'ipv6' list, and with an empty 'ip' when it has no IPv4 address
+    """
+    io = io or packet_io
+    found = 0
+    macs = dict()
+
+    iface = iface or find_iface(gw_ip) or default_iface()
+    network = network or get_iface_network(iface) or ipaddress.IPv4Interface(f'{gw_ip}/24')
+
+    # Seed from what the kernel already knows
+    start = time.monotonic()
+    unsure = dict()
+    for ip, mac, state in io.neighbours(iface):
+        try:
+            if ipaddress.IPv4Address(ip) not in network.network:
+                continue
+        except ValueError:
+            continue
+        if state in CONFIRMED_STATES:
+            host = {
+                'ip': ip,
+                'mac': mac,
+                'hostname': '',
+                'iface': iface
+            }
+            macs[mac] = ip
+            found += 1
+            yield host
+        elif mac not in (fresh or ()):
+            unsure[ip] = mac
+    seeded = set(macs.values())
+    for host in known or ():
+        if host['ip'] and host['ip'] not in seeded:
+            unsure.setdefault(host['ip'], host['mac'])
+    scan_duration.observe(time.monotonic() - start, phase='neighbour_table')
+
+    sweep = full or (full is None and sweep_due(iface))
+    neighbours = list()
+    ndp = Thread(target=lambda: neighbours.extend(discover_ipv6(iface, io)), daemon=True)
+    if ipv6 and sweep:
+        ndp.start()
+
+    if sweep:
+        targets = [ip for ip in scan_targets(network) if ip not in seeded]
+        logger.info(f'Sweeping {len(targets)} addresses of {network.network} on {iface} at {rate} probes/s, '
+                    f'{len(seeded)} known from the neighbour table')
+        last_sweeps[iface] = time.monotonic()
+
+        # First try ARP scan
+        start = time.monotonic()
+        for ip, mac in arp_sweep(iface, targets, rate=rate, io=io):
+            host = {
+                'ip': ip,
+                'mac': mac,
+                'hostname': '',
+                'iface': iface
+            }
+            macs[mac.lower()] = ip
+            found += 1
+            logger.debug(f"Found host: {host}")
+            yield host
+
+        scan_duration.observe(time.monotonic() - start, phase='arp_sweep')
+    else:
+        logger.info(f'{len(seeded)} hosts on {iface} known from the neighbour table, '
+                    f'probing {len(unsure)} stale ones')
+        start = time.monotonic()
+        for host in probe([{'ip': ip, 'mac': mac} for ip, mac in sorted(unsure.items())], iface=iface, io=io):
+            macs[host['mac'].lower()] = host['ip']
+            found += 1
+            yield host
+        scan_duration.observe(time.monotonic() - start, phase='stale_probe')
+
+    # If no hosts found, try ping scan as fallback
+    if not found and fallback and sweep:
+        logger.info("ARP scan found no hosts, trying ping scan...")
+        start = time.monotonic()
+        responders = io.ping(iface, targets, rate)
+        packets_sent.inc(len(targets), kind='icmp')
+        packets_received.inc(len(responders), kind='icmp')
+        for ip, mac in resolve_macs(iface, sorted(responders, key=ipaddress.ip_address), io=io):
+            host = {
+                'ip': ip,
+                'mac': mac,
+                'hostname': '',
+                'iface': iface
+            }
+            macs[mac.lower()] = ip
+            logger.debug(f"Found host via ping: {host}")
+            yield host
+        scan_duration.observe(time.monotonic() - start, phase='icmp_fallback')
+
+    if ipv6:
+        if sweep:
+            ndp.join()
+        else:
+            neighbours = [(ip, mac) for ip, mac, state in io.neighbours(iface, socket.AF_INET6)]
+        by_mac = dict()
+        for ip6, mac in neighbours:
+            by_mac.setdefault(mac.lower(), set()).add(ip6)
+        for mac, addrs in by_mac.items():
+            host = {
+                'ip': macs.get(mac, ''),
+                'mac': mac,
+                'hostname': '',
+                'iface': iface,
+                'ipv6': sorted(addrs)
+            }
+            logger.debug(f"Found host via NDP: {host}")
+            yield host
+
+
+def discover_ipv6(iface, io):
+    """
+    io.ndp_discover() with its run time recorded, errors only cost the IPv6 addresses
+    """
+    start = time.monotonic()
+    try:
+        return io.ndp_discover(iface)
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+        return list()
+    finally:
+        scan_duration.observe(time.monotonic() - start, phase='ndp')
+
+
+def iter_scan_all(gw_ip, rate=PROBE_RATE, ifaces=None, io=None, full=True, known=None, fresh=None):
+    """
+    iter_scan() on every interface in ifaces (all of scan_ifaces() by default)
+    at the same time, one worker each, hosts are yielded as any of them answers
+    so the whole scan takes as long as the slowest segment
+
+    full, known and fresh are passed on, each interface gets the known hosts last seen on it
+    """
+    gw_iface = find_iface(gw_ip) or default_iface()
+    ifaces = ifaces or scan_ifaces() or [gw_iface]
+    if len(ifaces) == 1:
+        yield from iter_scan(gw_ip, rate=rate, iface=ifaces[0], io=io, full=full,
+                             known=hosts_on(known, ifaces[0], gw_iface), fresh=fresh)
+        return
+
+    found = queue.Queue()
+    done = object()
+
+    def worker(iface):
+        try:
+            network = get_iface_network(iface)
+            # the slow ICMP fallback only for the gateway segment, an empty bridge
+            # or VLAN must not hold up the rest
+            for host in iter_scan(str(network.ip), rate=rate, iface=iface, network=network, io=io,
+                                  fallback=iface == gw_iface, full=full, known=hosts_on(known, iface, gw_iface),
+                                  fresh=fresh):
+                found.put(host)
+        except Exception as e:
+            logger.error(sys.exc_info()[1], exc_info=True)
+        finally:
+            found.put(done)
+
+    logger.info(f'Scanning {len(ifaces)} interfaces: {", ".join(ifaces)}')
+    for iface in ifaces:
+        Thread(target=worker, args=(iface,), daemon=True).start()
+    running = len(ifaces)
+    while running:
+        host = found.get()
+        if host is done:
+            running -= 1
+        else:
+            yield host
+
+
+def hosts_on(hosts, iface, gw_iface):
+    """
+    the hosts last seen on iface, the ones without an interface belong to gw_iface
+    """
+    return [host for host in hosts or () if (host.get('iface') or gw_iface) == iface]
+
+
+def active_scan(gw_ip, rate=PROBE_RATE, **kwargs):
+    """
+    the complete result of iter_scan() as a list
+    """
+    return list(iter_scan(gw_ip, rate=rate, **kwargs))
+
+
+def probe(hosts, timeout=1, iface=None, io=None):
+    """
+    re-check already known hosts with one unicast ARP request each,
+    returns the ones that answered
+    """
+    if not hosts:
+        return list()
+    io = io or packet_io
+    ans = io.arp_exchange(iface, [host['ip'] for host in hosts], timeout=timeout,
+                          macs={host['ip']: host['mac'] for host in hosts})
+    packets_sent.inc(len(hosts), kind='arp')
+    packets_received.inc(len(ans), kind='arp')
+    return [{'ip': ip, 'mac': mac, 'hostname': '', 'iface': iface} for ip, mac in ans]
@@ -1,35 +1,111 @@
 import sys
+import time
+import argparse
 import datetime as dt
 import json
+import queue
 import atexit
+import signal
 from setproctitle import setproctitle
 import logging
-import subprocess as sp
+from threading import Thread, Lock, Event
 import netifaces
-from scapy.all import *
-from bottle import route, run
+from bottle import route, run, install
 from bottle import request, response
+from bottle import server_names
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-
-
-from utils import logger
-from utils import get_default_gw, get_my, get_hostname, generate_mac
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+
+
+from logs import logger, log_pipeline, setup_logging, get_levels, set_level
+from resolver import hostnames
+from hosts import host_table
+from presence import presence
+from listener import ArpListener
+from monitor import ArpGuard
+from scanner import PROBE_RATE, MAX_PROBE_RATE, iter_scan_all, scan_ifaces, probe
+from backends import SERVERS, UnixServer
+from metrics import registry, Counter, Gauge, RequestTimer
+from metrics import scan_duration, hosts_found, job_lag, job_duration, jobs_missed
+from utils import net_context, generate_mac, set_mac_address
 from utils import enable_ip_forward, disable_ip_forward, arp_spoof, arp_unspoof
+from utils import OPEN_RULESET, protection_ruleset, load_arptables, set_static_neigh, del_static_neigh
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='TuxCut server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8013)
+    parser.add_argument('--server', default='threaded',
+                        choices=sorted(set(SERVERS) | set(server_names)),
+                        help='HTTP server backend, threaded by default, '
+                             'wsgiref serves one request at a time')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on this Unix domain socket instead of TCP, '
+                             'e.g. /run/tuxcut/tuxcutd.sock')
+    parser.add_argument('--socket-mode', type=lambda mode: int(mode, 8), default=0o660,
+                        help='permissions of the Unix socket, octal (default 660)')
+    parser.add_argument('--socket-group',
+                        help='group allowed to use the Unix socket')
+    parser.add_argument('--log-level', default='INFO', type=str.upper,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help='can also be changed at runtime through /log-level')
+    parser.add_argument('--log-max-size', type=int, default=5, metavar='MB',
+                        help='rotate the log file when it reaches this size (default 5 MB)')
+    parser.add_argument('--log-rotate', metavar='WHEN',
+                        help='rotate the log file by time instead of size, e.g. midnight or h')
+    parser.add_argument('--log-backups', type=int, default=5,
+                        help='rotated log files to keep (default 5)')
+    return parser.parse_args()
+
 
 setproctitle('tuxcut-server')
+args = parse_args()
+setup_logging(level=args.log_level, max_bytes=args.log_max_size * 1024 * 1024,
+              backups=args.log_backups, when=args.log_rotate)
 victims = list()
+victims_lock = Lock()
+# gateway pinned by /protect, so /unprotect can release it
+protected_gw = dict()
+stale_sweep = Lock()
+guard_refresh = Lock()
+listener_refresh = Lock()
+listener_pending = Event()
+# seconds between keep-alive events while a scan phase finds nothing, well
+# below the client's read timeout
+KEEPALIVE_INTERVAL = 10
 
 
 def attack_victims():
-    if len(victims) > 0:
+    with victims_lock:
+        targets = list(victims)
+    if len(targets) > 0:
         disable_ip_forward()
-        for victim in victims:
+        for victim in targets:
             arp_spoof(victim)
 
 
+job_started = dict()
+
+
+def on_job_event(event):
+    """
+    feed the job lag and duration metrics from the scheduler events
+    """
+    if event.code == EVENT_JOB_SUBMITTED:
+        lag = dt.datetime.now(dt.timezone.utc) - event.scheduled_run_times[-1]
+        job_lag.observe(max(lag.total_seconds(), 0), job=event.job_id)
+        job_started[event.job_id] = time.monotonic()
+    elif event.code == EVENT_JOB_MISSED:
+        jobs_missed.inc(job=event.job_id)
+    elif event.job_id in job_started:
+        job_duration.observe(time.monotonic() - job_started.pop(event.job_id), job=event.job_id)
+
+
 scheduler = BackgroundScheduler()
+scheduler.add_listener(on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
 scheduler.start()
 scheduler.add_job(
     func=attack_victims,
@@ -37,6 +113,18 @@ scheduler.add_job(
     id='arp_attack_job',
     name='ARP Spoofing the victim list',
     replace_existing=True)
+scheduler.add_job(
+    func=host_table.expire,
+    trigger=IntervalTrigger(seconds=30),
+    id='expire_hosts_job',
+    name='Expire hosts not seen lately',
+    replace_existing=True)
+scheduler.add_job(
+    func=presence.save,
+    trigger=IntervalTrigger(minutes=10),
+    id='save_presence_job',
+    name='Save the presence timelines',
+    replace_existing=True)
 
 
 # Shut down the scheduler when exiting the app
@@ -44,9 +132,116 @@ def on_server_exit():
     logger.info('TuxCut server is stopped')
     enable_ip_forward()
     scheduler.shutdown()
+    presence.save()
 
 
 atexit.register(on_server_exit)
+# systemd stops us with SIGTERM, exit normally so the atexit handlers run
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+install(RequestTimer())
+registry.register(Counter('tuxcut_dns_cache_hits_total', 'Hostname lookups answered from the cache',
+                          function=lambda: hostnames.hits))
+registry.register(Counter('tuxcut_dns_cache_misses_total', 'Hostname lookups that had to query DNS',
+                          function=lambda: hostnames.misses))
+registry.register(Gauge('tuxcut_dns_cache_hit_ratio', 'Share of hostname lookups answered from the cache',
+                        function=hostnames.hit_ratio))
+registry.register(Gauge('tuxcut_dns_cache_entries', 'Hostnames in the cache', function=hostnames.cached))
+registry.register(Gauge('tuxcut_host_table_size', 'Hosts in the live host table', function=lambda: len(host_table)))
+registry.register(Counter('tuxcut_log_records_dropped_total', 'Log records dropped because the writer fell behind',
+                          function=lambda: log_pipeline.dropped))
+
+presence.load()
+registry.register(Gauge('tuxcut_presence_hosts', 'Hosts with a presence timeline', function=lambda: len(presence)))
+
+# keep gateway and interface info cached until the kernel reports a change
+net_context.start()
+
+# keep the host table fresh from the ARP traffic on the gateway interface
+# and watch the same traffic for spoofed replies
+arp_guard = ArpGuard()
+arp_listener = ArpListener(host_table)
+arp_listener.add_handler(arp_guard.observe)
+ready = Event()
+startup = {'gateway': False}
+
+
+def listen_ifaces():
+    """
+    the interfaces the ARP listener should be on: every scanned one, or the gateway's
+    """
+    ifaces = scan_ifaces()
+    if not ifaces:
+        iface = net_context.gateway().get('iface')
+        ifaces = [iface] if iface else []
+    return sorted(ifaces)
+
+
+def warm_up():
+    """
+    load scapy, find the gateway and start the ARP listener in the background,
+    the API answers /status right away and /ready once this is done
+    """
+    start = time.monotonic()
+    try:
+        gw = net_context.gateway()
+        startup['gateway'] = bool(gw.get('mac'))
+        arp_guard.set_gateway(gw)
+        # with the network not up yet this stays off until netlink reports a change
+        arp_listener.retarget(listen_ifaces())
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+    finally:
+        ready.set()
+        logger.info('Ready after {:.2f}s'.format(time.monotonic() - start))
+
+
+Thread(target=warm_up, daemon=True).start()
+
+
+def refresh_guard():
+    """
+    trust the new gateway after the network changed, unless protection pinned one
+    """
+    if not guard_refresh.acquire(blocking=False):
+        return
+    try:
+        # netlink changes come in bursts, probe once they settled
+        time.sleep(1)
+        if not protected_gw:
+            arp_guard.set_gateway(net_context.gateway())
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+    finally:
+        guard_refresh.release()
+
+
+net_context.on_invalidate(lambda reason: Thread(target=refresh_guard, daemon=True).start())
+
+
+def refresh_listener():
+    """
+    move the ARP listener to the interfaces that are up now, after the network changed
+    """
+    listener_pending.set()
+    if not listener_refresh.acquire(blocking=False):
+        return
+    try:
+        # an interface coming up sends link, carrier and address events, follow them all
+        while listener_pending.is_set():
+            listener_pending.clear()
+            time.sleep(1)
+            arp_listener.retarget(listen_ifaces())
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+    finally:
+        listener_refresh.release()
+
+
+net_context.on_invalidate(lambda reason: Thread(target=refresh_listener, daemon=True).start())
+# names cached for the old network may belong to other hosts on the new one
+net_context.on_invalidate(lambda reason: hostnames.invalidate())
+
 
 @route('/status')
 def server_status():
@@ -61,6 +256,38 @@ def server_status():
     })
 
 
+@route('/ready')
+def server_ready():
+    """
+    check if the server is done starting up and can scan and cut
+    """
+    response.headers['Content-Type'] = 'application/json'
+    checks = {
+        'started': ready.is_set(),
+        'gateway': startup['gateway'],
+        'listener': arp_listener.running and arp_listener.ifaces == listen_ifaces()
+    }
+    if all(checks.values()):
+        status = 'success'
+    else:
+        status = 'starting' if not ready.is_set() else 'failed'
+        response.status = 503
+
+    return json.dumps({
+        'status': status,
+        'checks': checks
+    })
+
+
+@route('/metrics')
+def get_metrics():
+    """
+    counters and histograms in the Prometheus text format
+    """
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return registry.render()
+
+
 @route('/my/<iface>')
 def get_my_info(iface):
     """
@@ -68,11 +295,12 @@ def get_my_info(iface):
     """
     response.headers['Content-Type'] = 'application/json'
 
-    my = get_my(iface)
+    my = net_context.my(iface)
 
     return json.dumps({
         'status': 'success',
-        'my': my
+        'my': my,
+        'age': net_context.age()
     })
 
 
@@ -82,11 +310,12 @@ def get_gw():
     Get the default gw ip address with the iface
     """
     response.headers['Content-Type'] = 'application/json'
-    gw = get_default_gw()
+    gw = net_context.gateway()
     if gw:
         return json.dumps({
             'status': 'success',
-            'gw': gw
+            'gw': gw,
+            'age': net_context.age()
         })
     else:
         logger.info('No valid internet Connection')
@@ -96,58 +325,84 @@ def get_gw():
         })
 
 
+def sweep_stale():
+    """
+    actively re-probe the hosts the passive listener has not heard from lately
+    """
+    if not stale_sweep.acquire(blocking=False):
+        return
+    try:
+        stale = host_table.stale()
+        by_iface = dict()
+        for host in stale:
+            by_iface.setdefault(host.get('iface') or None, []).append(host)
+        for iface, hosts in by_iface.items():
+            for host in probe(hosts, iface=iface):
+                host_table.seen(host['ip'], host['mac'], iface=iface)
+        logger.debug(f'Re-probed {len(stale)} stale hosts')
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+    finally:
+        stale_sweep.release()
+
+
+def probe_rate():
+    """
+    ?rate= of the current request, ValueError unless it is 1 to MAX_PROBE_RATE probes per second
+    """
+    try:
+        rate = int(request.query.get('rate') or PROBE_RATE)
+    except ValueError:
+        raise ValueError('rate must be a whole number of probes per second')
+    if not 0 < rate <= MAX_PROBE_RATE:
+        raise ValueError('rate must be between 1 and {}'.format(MAX_PROBE_RATE))
+    return rate
+
+
 @route('/scan/<gw_ip>')
 def scan(gw_ip):
+    """
+    return the live host table, it is only refreshed with a scan when the
+    table is still empty or when asked for with ?full=1, ?rate= sets the
+    probes per second for the sweep
+
+    the sweep covers every interface with an IPv4 subnet at once, or
+    only the ones given with ?iface=
+    """
     response.headers['Content-Type'] = 'application/json'
-    live_hosts = list()
-    logger.info('Start scanning {}'.format(gw_ip))
-    
+
     try:
-        # Use more aggressive scanning
-        conf.verb = 0  # Suppress scapy output
-        
-        # First try ARP scan
-        ans, unans = srp(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=f"{gw_ip}/24"), 
-                        timeout=2, verbose=False)
-        
-        # Process responses
-        for snd, rcv in ans:
-            try:
-                host = {
-                    'ip': rcv.psrc,
-                    'mac': rcv.hwsrc,
-                    'hostname': get_hostname(rcv.psrc)
+        try:
+            rate = probe_rate()
+        except ValueError as e:
+            response.status = 400
+            return json.dumps({
+                'result': {
+                    'status': 'error',
+                    'msg': str(e),
+                    'hosts': []
                 }
-                if host not in live_hosts:
-                    live_hosts.append(host)
-                    logger.debug(f"Found host: {host}")
-            except Exception as e:
-                logger.error(f"Error processing host {rcv.psrc}: {str(e)}")
-        
-        # If no hosts found, try ping scan as fallback
-        if not live_hosts:
-            logger.info("ARP scan found no hosts, trying ping scan...")
-            ans, unans = sr(IP(dst=f"{gw_ip}/24")/ICMP(), timeout=2, verbose=False)
-            for snd, rcv in ans:
-                try:
-                    # Get MAC using ARP
-                    arp_ans = srp1(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=rcv.src), 
-                                timeout=1, verbose=False)
-                    if arp_ans:
-                        host = {
-                            'ip': rcv.src,
-                            'mac': arp_ans.hwsrc,
-                            'hostname': get_hostname(rcv.src)
-                        }
-                        if host not in live_hosts:
-                            live_hosts.append(host)
-                            logger.debug(f"Found host via ping: {host}")
-                except Exception as e:
-                    logger.error(f"Error processing ping response from {rcv.src}: {str(e)}")
-        
+            })
+        if request.query.get('full') or not len(host_table):
+            logger.info('Start scanning {}'.format(gw_ip))
+            full = True if request.query.get('full') else None
+            for host in iter_scan_all(gw_ip, rate=rate, ifaces=request.query.getall('iface'),
+                                      full=full, known=host_table.stale(), fresh=host_table.recent()):
+                host_table.seen(host['ip'], host['mac'], iface=host['iface'], ipv6=host.get('ipv6'))
+        else:
+            Thread(target=sweep_stale, daemon=True).start()
+
+        # Resolve all hostnames concurrently
+        start = time.monotonic()
+        live_hosts = host_table.hosts()
+        host_table.set_hostnames(hostnames.resolve_many([host['ip'] for host in live_hosts if host['ip']]))
+        live_hosts = host_table.hosts()
+        scan_duration.observe(time.monotonic() - start, phase='hostname_resolution')
+        hosts_found.set(len(live_hosts))
+
         logger.info(f'Found {len(live_hosts)} live hosts')
         logger.debug(f'Live hosts: {json.dumps(live_hosts)}')
-        
+
         return json.dumps({
             'result': {
                 'status': 'success',
@@ -166,20 +421,267 @@ def scan(gw_ip):
         })
 
 
+@route('/hosts')
+def get_hosts():
+    """
+    hosts added, changed and removed since the table version given with ?since=,
+    the whole table when ?epoch= is from an earlier run of the daemon
+    """
+    response.headers['Content-Type'] = 'application/json'
+    try:
+        since = int(request.query.get('since') or 0)
+    except ValueError:
+        since = 0
+    epoch = request.query.get('epoch')
+    if epoch and epoch != host_table.epoch:
+        since = -1
+
+    delta = host_table.changes(since)
+    delta['status'] = 'success'
+    return json.dumps(delta)
+
+
+@route('/bootstrap')
+def bootstrap():
+    """
+    everything the GUI needs at startup in one call: server status, gateway,
+    our own address on the gateway interface and the hosts known so far
+    """
+    response.headers['Content-Type'] = 'application/json'
+    try:
+        gw = net_context.gateway()
+        my = net_context.my(gw['iface']) if gw.get('iface') else dict()
+        snapshot = host_table.changes(0)
+        return json.dumps({
+            'status': 'success',
+            'ready': ready.is_set(),
+            'gw': gw,
+            'my': my,
+            'hosts': snapshot['added'],
+            'version': snapshot['version'],
+            'epoch': snapshot['epoch'],
+            'age': net_context.age()
+        })
+    except Exception as e:
+        logger.error(sys.exc_info()[1], exc_info=True)
+        return json.dumps({
+            'status': 'error',
+            'msg': str(e)
+        })
+
+
+def with_keepalive(items, interval=KEEPALIVE_INTERVAL):
+    """
+    yield from the iterator items, run in its own thread, and None whenever
+    interval seconds pass without an item, closing the generator stops items
+    """
+    found = queue.Queue()
+    stopped = Event()
+    done = object()
+
+    def pump():
+        try:
+            for item in items:
+                found.put(item)
+                if stopped.is_set():
+                    break
+        except Exception as e:
+            found.put(e)
+        finally:
+            items.close()
+            found.put(done)
+
+    Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            try:
+                item = found.get(timeout=interval)
+            except queue.Empty:
+                yield None
+                continue
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+@route('/scan-stream/<gw_ip>')
+def scan_stream(gw_ip):
+    """
+    newline delimited JSON events: the known hosts right away, then every new host
+    as it is found, then the resolved hostnames, with a progress event every
+    KEEPALIVE_INTERVAL seconds in which nothing was found
+
+    hosts come from the kernel neighbour table first, a full sweep is only done
+    every FULL_SWEEP_INTERVAL seconds or with ?full=1, in between only stale
+    hosts are probed. Like /scan, all interfaces are scanned at once unless
+    ?iface= picks some
+    """
+    try:
+        rate = probe_rate()
+    except ValueError as e:
+        response.status = 400
+        response.headers['Content-Type'] = 'application/json'
+        return json.dumps({
+            'status': 'error',
+            'msg': str(e)
+        })
+    response.headers['Content-Type'] = 'application/x-ndjson'
+    ifaces = request.query.getall('iface')
+    full = True if request.query.get('full') else None
+
+    def event(**kwargs):
+        return json.dumps(kwargs) + '\n'
+
+    def events():
+        sent = dict()
+        try:
+            # done carries this version, whatever changes during the scan the next /hosts poll replays
+            snapshot = host_table.changes(-1)
+            for host in snapshot['added']:
+                sent[host['mac']] = host
+                yield event(event='host', host=host)
+
+            logger.info('Start scanning {}'.format(gw_ip))
+            for found in with_keepalive(iter_scan_all(gw_ip, rate=rate, ifaces=ifaces, full=full,
+                                                      known=host_table.stale(), fresh=host_table.recent())):
+                if found is None:
+                    # a long silent phase like the ICMP fallback, keep the client's read timeout at bay
+                    yield event(event='progress', count=len(sent))
+                    continue
+                host_table.seen(found['ip'], found['mac'], iface=found['iface'], ipv6=found.get('ipv6'))
+                if found['ip']:
+                    hostnames.prefetch([found['ip']])
+                # send the merged record, NDP answers add to what the ARP sweep found
+                host = host_table.get(found['mac'])
+                if host is None:
+                    continue
+                mac = host['mac']
+                if mac not in sent or sent[mac]['ip'] != host['ip'] or sent[mac]['ipv6'] != host['ipv6']:
+                    sent[mac] = host
+                    yield event(event='host', host=host)
+
+            start = time.monotonic()
+            names = hostnames.resolve_many([host['ip'] for host in sent.values() if host['ip']])
+            host_table.set_hostnames(names)
+            scan_duration.observe(time.monotonic() - start, phase='hostname_resolution')
+            hosts_found.set(len(sent))
+            for mac, host in sent.items():
+                if names.get(host['ip']) and names[host['ip']] != host['hostname']:
+                    yield event(event='hostname', ip=host['ip'], mac=mac, hostname=names[host['ip']])
+
+            logger.info(f'Found {len(sent)} live hosts')
+            yield event(event='done', status='success', count=len(sent), version=snapshot['version'],
+                        epoch=snapshot['epoch'])
+        except Exception as e:
+            logger.error(f"Scan error: {str(e)}")
+            logger.error(sys.exc_info()[1], exc_info=True)
+            yield event(event='done', status='error', msg=str(e), count=len(sent))
+
+    return events()
+
+
+@route('/presence')
+def get_presence():
+    """
+    minutes online per hour over the last ?hours= hours (24 by default) for every
+    host, or hours online per day over the last ?days= days when that is given
+    """
+    response.headers['Content-Type'] = 'application/json'
+    try:
+        hours = int(request.query.get('hours') or 24)
+        days = int(request.query.get('days') or 0)
+    except ValueError:
+        hours, days = 24, 0
+    macs = [mac.lower() for mac in request.query.getall('mac')] or None
+
+    if days:
+        return json.dumps({
+            'status': 'success',
+            'days': days,
+            'presence': presence.daily(days, macs)
+        })
+    return json.dumps({
+        'status': 'success',
+        'hours': hours,
+        'presence': presence.hourly(hours, macs)
+    })
+
+
+@route('/arp-events')
+def get_arp_events():
+    """
+    ARP spoofing monitor events with an id after ?since=
+    """
+    response.headers['Content-Type'] = 'application/json'
+    try:
+        since = int(request.query.get('since') or 0)
+    except ValueError:
+        since = 0
+
+    return json.dumps({
+        'status': 'success',
+        'monitoring': arp_listener.running,
+        'last_id': arp_guard.last_id,
+        'events': arp_guard.events(since)
+    })
+
+
+@route('/log-level')
+def get_log_level():
+    """
+    the current log levels
+    """
+    response.headers['Content-Type'] = 'application/json'
+
+    return json.dumps({
+        'status': 'success',
+        'levels': get_levels()
+    })
+
+
+@route('/log-level', method='POST')
+def change_log_level():
+    """
+    set the tuxcut log level, or the one of the logger named in the form, e.g. apscheduler
+    """
+    response.headers['Content-Type'] = 'application/json'
+    try:
+        set_level(request.forms.get('level'), request.forms.get('logger') or 'tuxcut-server')
+        return json.dumps({
+            'status': 'success',
+            'levels': get_levels()
+        })
+    except ValueError as e:
+        response.status = 400
+        return json.dumps({
+            'status': 'error',
+            'msg': str(e)
+        })
+
+
 @route('/protect', method='POST')
 def enable_protection():
     response.headers['Content-Type'] = 'application/json'
 
     gw_ip = request.forms.get('ip')
     gw_mac = request.forms.get('mac')
+    iface = request.forms.get('iface') or net_context.gateway().get('iface')
 
     try:
-        sp.Popen(['arptables', '-F'])
-        sp.Popen(['arptables', '-P', 'INPUT', 'DROP'])
-        sp.Popen(['arptables', '-P', 'OUTPUT', 'DROP'])
-        sp.Popen(['arptables', '-A', 'INPUT', '-s', gw_ip, '--source-mac', gw_mac, '-j', 'ACCEPT'])
-        sp.Popen(['arptables', '-A', 'OUTPUT', '-d', gw_ip, '--destination-mac', gw_mac, '-j', 'ACCEPT'])
-        sp.Popen(['arp', '-s',  gw_ip, gw_mac ])
+        load_arptables(protection_ruleset(gw_ip, gw_mac))
+        try:
+            set_static_neigh(iface, gw_ip, gw_mac)
+        except Exception:
+            # all or nothing, don't leave DROP policies without the pinned gateway
+            load_arptables(OPEN_RULESET)
+            raise
+        protected_gw.update({'ip': gw_ip, 'iface': iface})
+        arp_guard.set_gateway({'ip': gw_ip, 'mac': gw_mac})
+        logger.info('Protection enabled for gateway {} {}'.format(gw_ip, gw_mac))
         return json.dumps({
             'status': 'success',
             'msg': 'Protection Enabled'
@@ -188,7 +690,7 @@ def enable_protection():
         logger.error(sys.exc_info()[1], exc_info=True)
         return json.dumps({
             'status': 'error',
-            'msg': sys.exc_info()[1]
+            'msg': str(e)
         })
 
 
@@ -196,9 +698,11 @@ def enable_protection():
 def disable_protection():
     response.headers['Content-Type'] = 'application/json'
     try:
-        sp.Popen(['arptables', '-P', 'INPUT', 'ACCEPT'])
-        sp.Popen(['arptables', '-P', 'OUTPUT', 'ACCEPT'])
-        sp.Popen(['arptables', '-F'])
+        load_arptables(OPEN_RULESET)
+        if protected_gw:
+            del_static_neigh(protected_gw['iface'], protected_gw['ip'])
+            protected_gw.clear()
+        logger.info('Protection disabled')
         return json.dumps({
             'status': 'success',
             'msg': 'Protection Disabled'
@@ -208,7 +712,7 @@ def disable_protection():
         logger.error(sys.exc_info()[1], exc_info=True)
         return json.dumps({
             'status': 'error',
-            'msg': sys.exc_info()[1]
+            'msg': str(e)
         })
 
 
@@ -217,8 +721,19 @@ def add_to_victims():
     response.headers['Content-Type'] = 'application/json'
 
     new_victim = request.json
-    if new_victim not in victims:
-        victims.append(new_victim)
+    # the spoofed packets go out on the gateway interface, posing as the default gateway
+    gw_iface = net_context.gateway().get('iface')
+    known = host_table.get(new_victim.get('mac', '')) or dict()
+    iface = known.get('iface') or gw_iface
+    if not new_victim.get('ip') or iface != gw_iface:
+        logger.info('Not cutting {}, it is not on the gateway interface {}'.format(new_victim, gw_iface))
+        return json.dumps({
+            'status': 'error',
+            'msg': 'Only hosts on {} can be cut'.format(gw_iface)
+        })
+    with victims_lock:
+        if new_victim not in victims:
+            victims.append(new_victim)
 
     return json.dumps({
         'status': 'success',
@@ -231,8 +746,8 @@ def resume_victim():
     response.headers['Content-Type'] = 'application/json'
 
     victim = request.json
-    if victim in victims:
-        victims.remove(victim)
+    with victims_lock:
+        victims[:] = [v for v in victims if v.get('mac') != victim.get('mac')]
     arp_unspoof(victim)
 
     return json.dumps({
@@ -241,14 +756,18 @@ def resume_victim():
     })
 
 @route('/change-mac/<iface>')
-def scan(iface):
+def change_mac(iface):
     response.headers['Content-Type'] = 'application/json'
     logger.info('Changing MAC Address for interface {}'.format(iface))
     new_MAC = generate_mac()
     try:
-        # sp.Popen(['ifconfig', iface, 'down'], stdout=sp.PIPE)
-        sp.Popen(['ifconfig', iface, 'down', 'hw', 'ether', new_MAC], stdout=sp.PIPE)
-        sp.Popen(['ifconfig', iface, 'up'], stdout=sp.PIPE)
+        if not set_mac_address(iface, new_MAC):
+            logger.error('Interface {} is not back up after the MAC change'.format(iface))
+            return json.dumps({
+                'result': {
+                    'status': 'failed'
+                }
+            })
         logger.info('MAC Address for interface {} Changed to {}'.format(iface, new_MAC))
         return json.dumps({
             'result': {
@@ -263,6 +782,11 @@ def scan(iface):
             }
         })
 
+
 if __name__ == '__main__':
-    run(host='127.0.0.1', port=8013, reloader=True)
-    logger.info('TuxCut server successfully started')
+    if args.unix:
+        logger.info('TuxCut server starting on {}'.format(args.unix))
+        run(server=UnixServer(args.unix, mode=args.socket_mode, group=args.socket_group), quiet=True)
+    else:
+        logger.info('TuxCut server starting with the {} backend'.format(args.server))
+        run(server=SERVERS.get(args.server, args.server), host=args.host, port=args.port, quiet=True)
